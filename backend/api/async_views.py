@@ -0,0 +1,274 @@
+"""Асинхронные обработчики GET горячих эндпоинтов чтения (ASGI).
+
+Включаются настройкой ASYNC_READS: wrap_async_reads() подменяет маршруты
+роутера DRF для списка и карточки рецепта, тегов, ингредиентов и подписок.
+Запросы к базе данных выполняются через асинхронный ORM, а синхронные части
+(аутентификация, проверка фильтров, справочники в памяти, счетчики версий
+в кеше) - переходом в поток через sync_to_async, чтобы не блокировать цикл
+событий.
+
+Всё, что асинхронный путь не обслуживает (запись, ?cursor=, ?count=,
+?format=, Browsable API, ошибки аутентификации и валидации, 404), передается
+исходному view DRF, поэтому тела ответов в обоих режимах совпадают.
+"""
+from api.cache import (check_conditional, get_recipes_version, get_request_key,
+                       get_versions_etag, patch_conditional)
+from api.replicas import use_primary
+from api.search import ingredient_index, similar_by_name
+from api.serializers import (RecipeSerializer, UserSubSerializer,
+                             aget_subscribed_ids)
+from api.views import (get_ingredient_query, get_positive_int,
+                       get_recipe_cache_control, get_recipe_validators,
+                       get_subscriptions)
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.http import HttpResponse
+from django.urls import URLPattern
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from recipes.models import Ingredient, Recipe
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+JSON_MEDIA_TYPES = {'*/*', 'application/*', 'application/json'}
+
+
+def accepts_json(request):
+    accept = request.META.get('HTTP_ACCEPT') or '*/*'
+    media_types = {item.split(';')[0].strip() for item in accept.split(',')}
+    return ('text/html' not in media_types
+            and bool(media_types & JSON_MEDIA_TYPES))
+
+
+def render_json(data, status=200):
+    response = HttpResponse(JSONRenderer().render(data), status=status,
+                            content_type='application/json')
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+class AsyncReadView(View):
+    """Асинхронный GET поверх маршрута viewset.
+
+    get() возвращает ответ или None; None означает, что запрос
+    обрабатывает синхронный view DRF (fallback).
+    """
+    viewset = None
+    fallback = None
+    fallback_params = ('format', 'cursor', 'count')
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.accepts(request, kwargs):
+            drf_request = await sync_to_async(self.prepare)(request)
+            if drf_request is not None:
+                response = await self.get(drf_request, *args, **kwargs)
+                if response is not None:
+                    return response
+        return await sync_to_async(self.fallback)(request, *args, **kwargs)
+
+    def accepts(self, request, kwargs):
+        return (request.method == 'GET'
+                and 'format' not in kwargs
+                and not any(param in request.GET
+                            for param in self.fallback_params)
+                and accepts_json(request))
+
+    def prepare(self, request):
+        request = Request(request, authenticators=[
+            auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            request.user
+        except APIException:
+            return None
+        return request
+
+    async def get(self, request, *args, **kwargs):
+        return None
+
+    async def paginate(self, queryset, request):
+        pagination = self.viewset.pagination_class()
+        paginator = pagination.django_paginator_class(
+            queryset, pagination.get_page_size(request))
+        paginator.count = await queryset.acount()
+        try:
+            page = paginator.page(
+                pagination.get_page_number(request, paginator))
+        except InvalidPage:
+            return None, None
+        page.object_list = [obj async for obj in page.object_list]
+        pagination.page, pagination.request = page, request
+        pagination.keyset_mode = False
+        return pagination, page.object_list
+
+    async def cached_response(self, request, handler, *args):
+        """Асинхронный аналог AnonymousCacheMixin.cached_response."""
+        if not request.user.is_anonymous:
+            data = await handler(request, *args)
+            return None if data is None else render_json(data)
+        version = await sync_to_async(get_recipes_version)()
+        key = get_request_key(request, self.viewset.cache_prefix)
+        cached = await cache.aget(key, version=version)
+        if cached is not None:
+            data, status = cached
+            response = render_json(data, status)
+            response['X-Cache'] = 'HIT'
+            return response
+        with use_primary():
+            data = await handler(request, *args)
+        if data is None:
+            return None
+        await cache.aset(key, (data, 200),
+                         timeout=settings.RECIPES_CACHE_TIMEOUT,
+                         version=version)
+        response = render_json(data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class RecipeListView(AsyncReadView):
+    def filter_queryset(self, request):
+        # Проверка фильтров может обращаться к базе (author), поэтому
+        # выполняется в потоке и только при промахе кеша.
+        filterset = self.viewset.filterset_class(
+            request.query_params,
+            queryset=Recipe.objects.with_related().with_user_flags(
+                request.user),
+            request=request)
+        return filterset.qs if filterset.is_valid() else None
+
+    async def get(self, request, *args, **kwargs):
+        return await self.cached_response(request, self.list)
+
+    async def list(self, request):
+        queryset = await sync_to_async(self.filter_queryset)(request)
+        if queryset is None:
+            return None
+        pagination, recipes = await self.paginate(queryset, request)
+        if pagination is None:
+            return None
+        if recipes:
+            await aget_subscribed_ids(request)
+        serializer = RecipeSerializer(
+            recipes, many=True, context={'request': request})
+        return pagination.get_paginated_response(serializer.data).data
+
+
+class RecipeDetailView(AsyncReadView):
+    async def get(self, request, pk):
+        try:
+            recipe = await Recipe.objects.filter(pk=pk).values(
+                'updated_at', 'author_id').afirst()
+        except ValueError:
+            return None
+        if recipe is None:
+            return None
+        etag, last_modified = await sync_to_async(get_recipe_validators)(
+            pk, recipe, request.user)
+        etag, timestamp, response = check_conditional(
+            request, etag, last_modified)
+        if response is None:
+            response = await self.cached_response(request, self.retrieve, pk)
+        if response is None:
+            return None
+        return patch_conditional(response, etag, timestamp,
+                                 get_recipe_cache_control(request.user))
+
+    async def retrieve(self, request, pk):
+        try:
+            recipe = await Recipe.objects.with_related().with_user_flags(
+                request.user).aget(pk=pk)
+        except Recipe.DoesNotExist:
+            return None
+        await aget_subscribed_ids(request)
+        return RecipeSerializer(recipe, context={'request': request}).data
+
+
+class SubscriptionsView(AsyncReadView):
+    async def get(self, request, *args, **kwargs):
+        if request.user.is_anonymous:
+            return None
+        context = {'request': request,
+                   'recipes_limit': get_positive_int(request,
+                                                     'recipes_limit')}
+        pagination, authors = await self.paginate(
+            get_subscriptions(request.user, context['recipes_limit']),
+            request)
+        if pagination is None:
+            return None
+        serializer = UserSubSerializer(authors, many=True, context=context)
+        return render_json(
+            pagination.get_paginated_response(serializer.data).data)
+
+
+class ReferenceView(AsyncReadView):
+    """Теги и ингредиенты из процессных справочников (api.reference)."""
+
+    async def get(self, request, pk=None):
+        etag = await sync_to_async(get_versions_etag)(
+            *self.viewset.etag_versions)
+        etag, timestamp, response = check_conditional(request, etag, None)
+        if response is None:
+            if pk is None:
+                data = await self.list(request)
+            else:
+                data = await self.retrieve(request, pk)
+            if data is None:
+                return None
+            response = render_json(data)
+        return patch_conditional(
+            response, etag, timestamp,
+            {'public': True, 'max_age': self.viewset.cache_max_age})
+
+    async def list(self, request):
+        return await sync_to_async(self.viewset.reference.all)()
+
+    async def retrieve(self, request, pk):
+        try:
+            pk = int(pk)
+        except ValueError:
+            return None
+        return await sync_to_async(self.viewset.reference.get_by_id)(pk)
+
+
+class IngredientListView(ReferenceView):
+    async def list(self, request):
+        name, limit = get_ingredient_query(request)
+        result = await sync_to_async(ingredient_index.search)(name, limit)
+        if result or not name:
+            return result
+        return [row async for row in similar_by_name(
+            Ingredient.objects.all(), name).values(
+            'id', 'name', 'measurement_unit')[:limit]]
+
+
+ASYNC_VIEWS = {
+    'recipes-list': RecipeListView,
+    'recipes-detail': RecipeDetailView,
+    'users-subscriptions': SubscriptionsView,
+    'tags-list': ReferenceView,
+    'tags-detail': ReferenceView,
+    'ingredients-list': IngredientListView,
+    'ingredients-detail': ReferenceView,
+}
+
+
+def wrap_async_reads(urlpatterns):
+    """Подменяет маршруты из ASYNC_VIEWS асинхронными view.
+
+    Исходный view DRF остается fallback для остальных методов и режимов.
+    """
+    patterns = []
+    for pattern in urlpatterns:
+        view_class = ASYNC_VIEWS.get(pattern.name)
+        if view_class is not None:
+            view = view_class.as_view(
+                viewset=pattern.callback.cls, fallback=pattern.callback)
+            view.csrf_exempt = True
+            pattern = URLPattern(
+                pattern.pattern, view, pattern.default_args, pattern.name)
+        patterns.append(pattern)
+    return patterns
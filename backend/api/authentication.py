@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from copy import copy
+
+from api.cache import get_versions, is_shared_cache
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+
+def get_auth_version_name(user_id):
+    return f'auth:{user_id}'
+
+
+class TokenCache:
+    """Ограниченный LRU-кеш токен -> (пользователь, токен) с TTL.
+
+    Запись действительна, пока не истек AUTH_TOKEN_CACHE_TTL и не
+    изменилась версия auth:<id пользователя> в общем кеше. Версию повышают
+    сигналы api.signals при выходе (удалении токена), сохранении
+    пользователя (смена пароля, деактивация) и изменении его прав.
+
+    Если кеш по умолчанию не общий (LocMemCache), другие воркеры не видят
+    новую версию, поэтому запись живет лишь AUTH_TOKEN_LOCAL_CACHE_TTL
+    секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, version, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        user, _ = value
+        name = get_auth_version_name(user.pk)
+        if get_versions(name)[name] != version:
+            self.delete(key)
+            return None
+        return value
+
+    def get_ttl(self):
+        if is_shared_cache():
+            return settings.AUTH_TOKEN_CACHE_TTL
+        return settings.AUTH_TOKEN_LOCAL_CACHE_TTL
+
+    def set(self, key, value, version):
+        expires = time.monotonic() + self.get_ttl()
+        with self._lock:
+            self._entries[key] = (value, version, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе на каждый запрос.
+
+    Пользователь кешируется вместе с набором его прав, поэтому проверки
+    DjangoModelPermissions тоже не обращаются к базе. Каждый запрос
+    получает собственную копию объекта пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            user, token = cached
+            return copy(user), token
+        user, token = super().authenticate_credentials(key)
+        name = get_auth_version_name(user.pk)
+        version = get_versions(name)[name]
+        if not user.is_superuser:
+            user.get_all_permissions()
+        token_cache.set(key, (user, token), version)
+        return copy(user), token
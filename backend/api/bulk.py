@@ -0,0 +1,174 @@
+"""Выгрузка и загрузка каталога рецептов в формате NDJSON.
+
+Каждая строка - один рецепт с тегами (slug) и ингредиентами (название и
+единица измерения), поэтому файл переносится между базами с разными id.
+"""
+import json
+from collections import Counter
+from itertools import islice
+
+from api.cache import bump_recipes_version
+from api.reference import tag_reference
+from api.serializers import RecipeImportSerializer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from recipes import counters
+from recipes.images import schedule_variants
+from recipes.models import Ingredient, IngredientAmount, Recipe
+
+User = get_user_model()
+
+INVALID_JSON_ERROR = 'Строка не является JSON-объектом'
+TAG_NOT_FOUND_ERROR = 'Теги не найдены: {}'
+INGREDIENT_NOT_FOUND_ERROR = 'Ингредиенты не найдены: {}'
+AUTHOR_NOT_FOUND_ERROR = 'Пользователь {} не найден'
+
+
+def export_lines(queryset):
+    """Построчно сериализует рецепты, читая базу порциями.
+
+    На PostgreSQL iterator() использует серверный курсор, а prefetch тегов
+    и ингредиентов выполняется для каждой порции отдельно.
+    """
+    for recipe in queryset.iterator(
+            chunk_size=settings.RECIPES_EXPORT_CHUNK_SIZE):
+        line = {
+            'id': recipe.pk,
+            'author': recipe.author.email,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'image': recipe.image.name,
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                {'name': amount.ingredient.name,
+                 'measurement_unit': amount.ingredient.measurement_unit,
+                 'amount': amount.amount}
+                for amount in recipe.ingredient_amount.all()],
+        }
+        yield json.dumps(line, ensure_ascii=False) + '\n'
+
+
+class RecipeImporter:
+    """Загружает рецепты пачками по RECIPES_IMPORT_BATCH_SIZE строк.
+
+    Строки с ошибками пропускаются и попадают в отчет с номером строки,
+    остальные строки пачки сохраняются через bulk_create в одной
+    транзакции.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.created = 0
+        self.errors = []
+
+    def run(self, lines):
+        lines = enumerate(lines, start=1)
+        while True:
+            batch = list(islice(lines, settings.RECIPES_IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+            self.import_batch(batch)
+        if self.created:
+            bump_recipes_version()
+        self.errors.sort(key=lambda error: error['line'])
+        return {'created': self.created, 'errors': self.errors}
+
+    def import_batch(self, batch):
+        valid = []
+        for number, line in batch:
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                self.errors.append({'line': number,
+                                    'errors': INVALID_JSON_ERROR})
+                continue
+            serializer = RecipeImportSerializer(data=data)
+            if serializer.is_valid():
+                valid.append((number, serializer.validated_data))
+            else:
+                self.errors.append({'line': number,
+                                    'errors': serializer.errors})
+        valid = self.resolve(valid)
+        if valid:
+            with transaction.atomic():
+                self.save(valid)
+
+    def resolve(self, rows):
+        """Заменяет slug, названия и email на id одним запросом на пачку."""
+        tags = tag_reference.get()['by_slug']
+        pairs = {(ingredient['name'], ingredient['measurement_unit'])
+                 for _, data in rows for ingredient in data['ingredients']}
+        ingredients = {
+            (name, unit): pk for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in pairs}).values_list(
+                'pk', 'name', 'measurement_unit')}
+        emails = {data['author'] for _, data in rows if data.get('author')}
+        authors = dict(User.objects.filter(email__in=emails).values_list(
+            'email', 'pk'))
+
+        resolved = []
+        for number, data in rows:
+            errors = {}
+            missing = [slug for slug in data['tags'] if slug not in tags]
+            if missing:
+                errors['tags'] = TAG_NOT_FOUND_ERROR.format(
+                    ', '.join(missing))
+            missing = [
+                ingredient['name'] for ingredient in data['ingredients']
+                if (ingredient['name'], ingredient['measurement_unit'])
+                not in ingredients]
+            if missing:
+                errors['ingredients'] = INGREDIENT_NOT_FOUND_ERROR.format(
+                    ', '.join(missing))
+            author = data.get('author')
+            if author and author not in authors:
+                errors['author'] = AUTHOR_NOT_FOUND_ERROR.format(author)
+            if errors:
+                self.errors.append({'line': number, 'errors': errors})
+                continue
+            data['author_id'] = authors.get(author, self.user.pk)
+            data['tag_ids'] = {tags[slug]['id'] for slug in data['tags']}
+            data['amounts'] = {
+                ingredients[(ingredient['name'],
+                             ingredient['measurement_unit'])]:
+                ingredient['amount']
+                for ingredient in data['ingredients']}
+            resolved.append(data)
+        return resolved
+
+    def save(self, rows):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author_id=data['author_id'], name=data['name'],
+                   text=data['text'], cooking_time=data['cooking_time'],
+                   image=data.get('image') or 'default.jpg')
+            for data in rows)
+        # pub_date заполняется auto_now_add, поэтому исходные даты
+        # восстанавливаются отдельным обновлением.
+        dated = []
+        for recipe, data in zip(recipes, rows):
+            if data.get('pub_date'):
+                recipe.pub_date = data['pub_date']
+                dated.append(recipe)
+        if dated:
+            Recipe.objects.bulk_update(dated, ('pub_date',))
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient_id=pk, amount=amount)
+            for recipe, data in zip(recipes, rows)
+            for pk, amount in data['amounts'].items())
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag_id=pk)
+            for recipe, data in zip(recipes, rows)
+            for pk in data['tag_ids'])
+        for author_id, count in Counter(
+                recipe.author_id for recipe in recipes).items():
+            counters.change(User, author_id, 'recipes_count', count)
+        for recipe in recipes:
+            schedule_variants(recipe)
+        self.created += len(recipes)
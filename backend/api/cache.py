@@ -0,0 +1,181 @@
+from hashlib import md5
+
+from api.replicas import use_primary
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def is_shared_cache():
+    """Виден ли кеш по умолчанию всем воркерам (Redis, Memcached, БД)."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS],
+                          (LocMemCache, DummyCache))
+
+
+def require_shared_cache():
+    """Режимы, которые хранят состояние в кеше, требуют общий кеш.
+
+    Список отзыва JWT и версии auth:<id> должны видеть все воркеры, иначе
+    выход или смена пароля действуют только в одном из них. То же для
+    закрепления за primary после записи (api.replicas): следующий запрос
+    пользователя может попасть в другой воркер.
+    """
+    if is_shared_cache():
+        return
+    features = []
+    if settings.AUTH_MODE != 'token':
+        features.append(f'AUTH_MODE={settings.AUTH_MODE}')
+    if settings.DATABASE_REPLICAS:
+        features.append('DB_REPLICAS')
+    if features:
+        verb = 'требует' if len(features) == 1 else 'требуют'
+        raise ImproperlyConfigured(
+            f'{", ".join(features)} {verb} общий для воркеров кеш: '
+            'укажите CACHE_BACKEND (например, RedisCache)')
+
+
+def get_versions(*names):
+    """Счетчики версий таблиц/пользователей из общего кеша."""
+    keys = {f'version:{name}': name for name in names}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, 1, timeout=None)
+        versions[key] = cache.get(key, 1)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_version(name):
+    # Версия повышается после коммита, чтобы параллельный запрос не
+    # закешировал рецепт с частично записанными ингредиентами и тегами.
+    key = f'version:{name}'
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def get_recipes_version():
+    return get_versions('recipes')['recipes']
+
+
+def bump_recipes_version():
+    bump_version('recipes')
+
+
+def get_request_key(request, prefix):
+    query = '&'.join(
+        f'{key}={value}'
+        for key in sorted(request.query_params)
+        for value in sorted(request.query_params.getlist(key)))
+    raw = f'{request.get_host()}{request.path}?{query}'
+    return f'{prefix}:{md5(raw.encode()).hexdigest()}'
+
+
+def get_versions_etag(*names):
+    versions = get_versions(*names)
+    return '-'.join(f'{name}{versions[name]}' for name in names)
+
+
+def check_conditional(request, etag, last_modified):
+    """Возвращает (ETag, метка времени, ответ 304/412 или None)."""
+    etag = quote_etag(etag)
+    timestamp = last_modified.timestamp() if last_modified else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp)
+    return etag, timestamp, response
+
+
+def patch_conditional(response, etag, timestamp, cache_control):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, **cache_control)
+        patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+class AnonymousCacheMixin:
+    """Кеширует ответы list/retrieve для анонимных пользователей.
+
+    Ключ строится из нормализованной строки запроса, а все записи
+    привязаны к общей версии рецептов: сигналы из api.signals повышают
+    её при изменении рецептов, ингредиентов и тегов.
+    """
+    cache_prefix = 'recipes'
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        version = get_recipes_version()
+        key = get_request_key(request, self.cache_prefix)
+        cached = cache.get(key, version=version)
+        if cached is not None:
+            data, status = cached
+            return Response(data, status=status, headers={'X-Cache': 'HIT'})
+        with use_primary():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, (response.data, response.status_code),
+                      timeout=settings.RECIPES_CACHE_TIMEOUT,
+                      version=version)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 Not Modified без сериализации данных.
+
+    Валидаторы строятся из счетчиков версий (etag_versions) и, при
+    необходимости, меток времени, а не из хеша отрендеренного тела.
+    """
+    etag_versions = ()
+    conditional_actions = ('list', 'retrieve')
+    cache_max_age = 300
+
+    def get_validators(self, request, *args, **kwargs):
+        return get_versions_etag(*self.etag_versions), None
+
+    def get_cache_control(self, request):
+        return {'public': True, 'max_age': self.cache_max_age}
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        etag, timestamp, response = check_conditional(
+            request, etag, last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        return patch_conditional(
+            response, etag, timestamp, self.get_cache_control(request))
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.conditional_actions:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.conditional_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request, super().retrieve, *args, **kwargs)
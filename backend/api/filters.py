@@ -1,12 +1,19 @@
-from django_filters import ChoiceFilter, FilterSet, ModelMultipleChoiceFilter
-from recipes.models import Recipe, Tag
+from api.reference import tag_reference
+from api.search import similar_by_name
+from django_filters import (CharFilter, ChoiceFilter, FilterSet,
+                            MultipleChoiceFilter)
+from recipes.models import Recipe
+
+
+def get_tag_slug_choices():
+    return tag_reference.slug_choices()
 
 
 class RecipeFilter(FilterSet):
-    tags = ModelMultipleChoiceFilter(
+    tags = MultipleChoiceFilter(
         field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+        choices=get_tag_slug_choices,
+        distinct=True,
     )
     STATUS_CHOICES = (
         (0, 'false'),
@@ -16,6 +23,7 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = ChoiceFilter(
         method='filter_is_in_shopping_cart',
         choices=STATUS_CHOICES)
+    name = CharFilter(method='filter_name')
 
     class Meta:
         model = Recipe
@@ -28,11 +36,14 @@ class RecipeFilter(FilterSet):
         user = self.request.user
 
         if value and not user.is_anonymous:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(shopping_cart__user=user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def filter_name(self, queryset, name, value):
+        return similar_by_name(queryset, value)
@@ -0,0 +1,136 @@
+"""Учет SQL-запросов каждого HTTP-запроса и поиск N+1.
+
+record_query подключается ко всем соединениям (см. api.signals) и считает
+запросы и время в базе данных, пока query_stats_middleware держит в
+контексте объект QueryStats. Запросы, выполняемые при отдаче потоковых
+ответов (выгрузки), в статистику не попадают.
+
+По итогам запроса пишется строка JSON в логгер api.queries, а при DEBUG или
+для персонала (is_staff) выставляется и заголовок Server-Timing. Одинаковые
+по форме запросы, повторенные не меньше QUERY_REPEAT_THRESHOLD раз, и
+превышение бюджета QUERY_BUDGETS для маршрута ('GET recipes-list' или
+'recipes-list' для всех методов) попадают в предупреждение, а при
+QUERY_BUDGET_STRICT (в тестах) вызывают QueryBudgetError.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from api.replicas import get_known_user
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger('api.queries')
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+query_stats = ContextVar('query_stats', default=None)
+
+
+class QueryBudgetError(AssertionError):
+    pass
+
+
+def get_shape(sql):
+    """Форма запроса: без длины списков IN и числовых литералов."""
+    return NUMBER.sub('N', IN_LIST.sub('(%s...)', sql))
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[get_shape(sql)] += 1
+
+    def get_repeated(self):
+        return [{'sql': shape, 'count': count}
+                for shape, count in self.shapes.most_common()
+                if count >= settings.QUERY_REPEAT_THRESHOLD]
+
+
+def record_query(execute, sql, params, many, context):
+    stats = query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - start)
+
+
+def report(request, response, stats, started):
+    total = (time.perf_counter() - started) * 1000
+    db_time = stats.duration * 1000
+    # Пользователь, если он уже определен: для анонимов и клиентов API
+    # заголовок не выставляется, чтобы не раскрывать время работы базы.
+    user = get_known_user(request)
+    if settings.DEBUG or (user is not None and user.is_staff):
+        response['Server-Timing'] = (
+            f'db;dur={db_time:.2f};desc="{stats.count} queries", '
+            f'app;dur={total:.2f}')
+    match = request.resolver_match
+    route = match.view_name if match else None
+    budget = settings.QUERY_BUDGETS.get(
+        f'{request.method} {route}', settings.QUERY_BUDGETS.get(route))
+    record = {
+        'method': request.method,
+        'path': request.path,
+        'route': route,
+        'status': response.status_code,
+        'queries': stats.count,
+        'db_ms': round(db_time, 2),
+        'total_ms': round(total, 2),
+    }
+    problems = []
+    repeated = stats.get_repeated()
+    if repeated:
+        record['repeated'] = repeated
+        problems.append(f'повторяющиеся запросы: {repeated[0]["sql"]} '
+                        f'x{repeated[0]["count"]}')
+    if budget is not None and stats.count > budget:
+        record['budget'] = budget
+        problems.append(f'{stats.count} запросов при бюджете {budget}')
+    message = json.dumps(record, ensure_ascii=False)
+    if not problems:
+        logger.info(message)
+        return
+    logger.warning(message)
+    if settings.QUERY_BUDGET_STRICT:
+        raise QueryBudgetError(
+            f'{request.method} {request.path}: ' + '; '.join(problems))
+
+
+@sync_and_async_middleware
+def query_stats_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats, started = QueryStats(), time.perf_counter()
+            token = query_stats.set(stats)
+            try:
+                response = await get_response(request)
+            finally:
+                query_stats.reset(token)
+            report(request, response, stats, started)
+            return response
+    else:
+        def middleware(request):
+            stats, started = QueryStats(), time.perf_counter()
+            token = query_stats.set(stats)
+            try:
+                response = get_response(request)
+            finally:
+                query_stats.reset(token)
+            report(request, response, stats, started)
+            return response
+    return middleware
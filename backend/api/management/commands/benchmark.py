@@ -0,0 +1,149 @@
+import json
+import statistics
+import time
+from typing import Any
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import (BaseCommand, CommandError,
+                                         CommandParser)
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Recipe
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+METRICS = ('p50', 'p95', 'p99', 'queries', 'bytes')
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку (p50/p95/p99), число SQL-запросов и размер '
+            'ответа основных эндпоинтов API на текущей базе данных')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя для авторизованных запросов; по умолчанию '
+                 'пользователь с наибольшим числом подписок')
+        parser.add_argument(
+            '--only', action='append',
+            help='Запустить только указанные сценарии')
+        parser.add_argument(
+            '--save', metavar='PATH',
+            help='Сохранить результаты как базовую линию в JSON')
+        parser.add_argument(
+            '--compare', metavar='PATH',
+            help='Сравнить результаты с сохраненной базовой линией')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Допустимый рост метрики относительно базовой линии, %%')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        client = APIClient()
+        client.force_authenticate(self.get_user(options.get('user')))
+        scenarios = self.get_scenarios()
+        if options.get('only'):
+            scenarios = {name: url for name, url in scenarios.items()
+                         if name in options['only']}
+
+        results = {}
+        for name, url in scenarios.items():
+            results[name] = self.measure(
+                client, url, options['iterations'], options['warmup'])
+            self.report(name, results[name])
+
+        if options.get('save'):
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Базовая линия сохранена в {options["save"]}')
+        if options.get('compare'):
+            self.compare(results, options['compare'], options['threshold'])
+
+    def get_user(self, pk):
+        if pk:
+            return User.objects.get(pk=pk)
+        user = User.objects.annotate(
+            subs=Count('subscriber')).order_by('-subs').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей. Выполните '
+                               'generate_data')
+        return user
+
+    def get_scenarios(self):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        scenarios = {
+            'recipes-list': '/api/recipes/',
+            'recipes-list-999': '/api/recipes/?limit=999',
+            'recipes-favorited': '/api/recipes/?is_favorited=1',
+            'users-list': '/api/users/',
+            'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+            'tags': '/api/tags/',
+            'ingredients-all': '/api/ingredients/',
+            'ingredients-search': '/api/ingredients/?name=са',
+            'shopping-cart-txt': '/api/recipes/download_shopping_cart/',
+        }
+        if recipe is not None:
+            scenarios['recipe-detail'] = f'/api/recipes/{recipe.pk}/'
+        return scenarios
+
+    def measure(self, client, url, iterations, warmup):
+        for _ in range(warmup):
+            self.request(client, url)
+        timings, queries, sizes = [], [], []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                size = self.request(client, url)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+            sizes.append(size)
+        return {
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'p99': percentile(timings, 99),
+            'queries': statistics.median(queries),
+            'bytes': statistics.median(sizes),
+        }
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.status_code >= 400:
+            raise CommandError(f'{url}: статус {response.status_code}')
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<22} p50={result["p50"]:8.2f} мс '
+            f'p95={result["p95"]:8.2f} мс p99={result["p99"]:8.2f} мс '
+            f'запросов={result["queries"]:<5g} байт={result["bytes"]:.0f}')
+
+    def compare(self, results, path, threshold):
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, result in results.items():
+            for metric in METRICS:
+                old = baseline.get(name, {}).get(metric)
+                if not old:
+                    continue
+                change = (result[metric] - old) / old * 100
+                if change > threshold:
+                    regressions.append(
+                        f'{name}.{metric}: {old:g} -> {result[metric]:g} '
+                        f'(+{change:.0f}%)')
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно базовой линии:\n'
+                + '\n'.join(regressions))
+        self.stdout.write('Регрессий относительно базовой линии нет')
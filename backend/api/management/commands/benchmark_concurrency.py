@@ -0,0 +1,105 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import requests
+from api.management.commands.benchmark import Command as BenchmarkCommand
+from api.management.commands.benchmark import percentile
+from api.tokens import UserRefreshToken
+from django.conf import settings
+from django.core.management.base import CommandError, CommandParser
+from rest_framework.authtoken.models import Token
+
+SCENARIOS = (
+    'recipes-list',
+    'recipe-detail',
+    'subscriptions',
+    'tags',
+    'ingredients-search',
+)
+
+
+class Command(BenchmarkCommand):
+    help = ('Сравнивает пропускную способность и задержку запущенных '
+            'серверов (например, gunicorn с синхронными воркерами и ASGI с '
+            'ASYNC_READS=true) под параллельной нагрузкой')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--target', action='append', required=True,
+            metavar='NAME=URL',
+            help='Сервер для сравнения, например sync=http://127.0.0.1:8000')
+        parser.add_argument(
+            '--concurrency', type=int, action='append',
+            help='Число одновременных запросов; по умолчанию 1, 8 и 32')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя для авторизованных запросов; по умолчанию '
+                 'пользователь с наибольшим числом подписок')
+        parser.add_argument(
+            '--only', action='append',
+            help='Запустить только указанные сценарии')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        targets = []
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError(f'Ожидается NAME=URL, получено {target}')
+            targets.append((name, url.rstrip('/')))
+        self.headers = self.get_auth_headers(self.get_user(options['user']))
+        self.timeout = options['timeout']
+        self.local = threading.local()
+        scenarios = {name: url for name, url in self.get_scenarios().items()
+                     if name in (options.get('only') or SCENARIOS)}
+
+        for name, path in scenarios.items():
+            for concurrency in options['concurrency'] or (1, 8, 32):
+                baseline = None
+                for target, base_url in targets:
+                    result = self.load(
+                        base_url + path, concurrency, options['requests'])
+                    baseline = baseline or result['rps']
+                    self.stdout.write(
+                        f'{name:<20} c={concurrency:<4} {target:<8} '
+                        f'rps={result["rps"]:8.1f} '
+                        f'p50={result["p50"]:8.2f} мс '
+                        f'p95={result["p95"]:8.2f} мс '
+                        f'ошибок={result["errors"]:<4} '
+                        f'x{result["rps"] / baseline:.2f}')
+
+    def get_auth_headers(self, user):
+        if settings.AUTH_MODE == 'jwt':
+            access = UserRefreshToken.for_user(user).access_token
+            return {'Authorization': f'Bearer {access}'}
+        token, _ = Token.objects.get_or_create(user=user)
+        return {'Authorization': f'Token {token.key}'}
+
+    def load(self, url, concurrency, total):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(self.fetch, [url] * concurrency))
+            start = time.perf_counter()
+            results = list(executor.map(self.fetch, [url] * total))
+            elapsed = time.perf_counter() - start
+        timings = [timing for timing, ok in results if ok]
+        return {
+            'rps': len(timings) / elapsed,
+            'p50': percentile(timings, 50) if timings else 0,
+            'p95': percentile(timings, 95) if timings else 0,
+            'errors': total - len(timings),
+        }
+
+    def fetch(self, url):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.headers.update(self.headers)
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            return 0, False
+        return (time.perf_counter() - start) * 1000, response.status_code < 400
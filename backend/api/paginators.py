@@ -1,7 +1,130 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
     max_page_size = 999
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator, берущий число строк из оценки планировщика PostgreSQL.
+
+    Точный COUNT(*) выполняется, только если оценка меньше
+    APPROXIMATE_COUNT_THRESHOLD или база данных не PostgreSQL.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate >= settings.APPROXIMATE_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class FeedPagination(LimitPageNumberPagination):
+    """Постраничная навигация ленты с двумя дополнительными режимами.
+
+    ?cursor=... (или ?cursor= для первой страницы) включает keyset-режим:
+    страница выбирается условием по полям view.keyset_ordering, а не
+    OFFSET, поэтому глубокие страницы стоят столько же, сколько первая.
+    ?count=approximate подставляет в count оценку планировщика.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.cursor_query_param in request.query_params
+        if not self.keyset_mode:
+            approximate = (request.query_params.get(self.count_query_param)
+                           == 'approximate')
+            self.django_paginator_class = (
+                ApproximateCountPaginator if approximate else Paginator)
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = view.keyset_ordering
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param])
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(
+                queryset.model, position))
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_keyset_filter(self, model, position):
+        names = [field.lstrip('-') for field in self.ordering]
+        try:
+            values = [model._meta.get_field(name).to_python(value)
+                      for name, value in zip(names, position)]
+        except ValidationError:
+            raise NotFound('Неверный курсор')
+        condition = None
+        for index, field in enumerate(self.ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**dict(zip(names[:index], values[:index])),
+                     **{f'{names[index]}__{lookup}': values[index]})
+            condition = step if condition is None else condition | step
+        return condition
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [
+            getattr(last, field.lstrip('-')) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(position))
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, default=str).encode()
+        return urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            position = json.loads(urlsafe_b64decode(cursor + padding))
+        except (TypeError, ValueError):
+            raise NotFound('Неверный курсор')
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound('Неверный курсор')
+        return position
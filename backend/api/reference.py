@@ -0,0 +1,80 @@
+import threading
+import time
+
+from api.cache import get_versions
+from api.replicas import use_primary
+from django.conf import settings
+from recipes.models import Tag
+
+
+class ReferenceData:
+    """Процессный кеш почти неизменяемого справочника.
+
+    Данные хранятся в памяти воркера. Не чаще раза в
+    REFERENCE_DATA_CHECK_INTERVAL секунд сверяется счетчик версии
+    version_name в общем кеше (его повышают сигналы api.signals), поэтому
+    правки из админки доходят до всех воркеров за несколько секунд.
+    Для этого нужен общий для воркеров кеш (CACHE_BACKEND): с LocMemCache
+    каждый воркер видит только свои изменения.
+
+    load - функция без аргументов, которая читает справочник из базы.
+    """
+
+    def __init__(self, version_name, load):
+        self.version_name = version_name
+        self.load = load
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._checked = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+    def get(self, force=False):
+        now = time.monotonic()
+        data = self._data
+        interval = settings.REFERENCE_DATA_CHECK_INTERVAL
+        if not force and data is not None and now - self._checked < interval:
+            return data
+        with self._lock:
+            version = get_versions(self.version_name)[self.version_name]
+            if force or self._data is None or version != self._version:
+                with use_primary():
+                    self._data = self.load()
+                self._version = version
+            self._checked = now
+            return self._data
+
+    def get_by_id(self, pk):
+        return self.get()['by_id'].get(pk)
+
+    def missing_ids(self, ids):
+        # Перед отказом справочник перечитывается: запись могла появиться
+        # в другом воркере до истечения интервала проверки версии.
+        ids = set(ids)
+        missing = ids - self.get()['by_id'].keys()
+        if not missing:
+            return missing
+        return ids - self.get(force=True)['by_id'].keys()
+
+
+def load_tags():
+    rows = list(Tag.objects.values('id', 'name', 'color', 'slug'))
+    return {
+        'list': rows,
+        'by_id': {row['id']: row for row in rows},
+        'by_slug': {row['slug']: row for row in rows},
+    }
+
+
+class TagReference(ReferenceData):
+    def all(self):
+        return self.get()['list']
+
+    def slug_choices(self):
+        return [(slug, slug) for slug in self.get()['by_slug']]
+
+
+tag_reference = TagReference('tags', load_tags)
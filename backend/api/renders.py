@@ -1,17 +1,68 @@
+import csv
 import io
+import tempfile
+from itertools import chain
 
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.pdfgen import canvas
 from rest_framework import renderers
 
 INGREDIENT_DATA_FILE_HEADERS = ('Название', 'Кол-во', 'Ед. измерения')
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
-class IngredientDataRendererTXT(renderers.BaseRenderer):
+def get_detail(data):
+    if isinstance(data, dict):
+        if 'detail' in data:
+            return str(data['detail'])
+        return '; '.join(f'{key}: {get_detail(value)}'
+                         for key, value in data.items())
+    if isinstance(data, (list, tuple)):
+        return '; '.join(get_detail(value) for value in data)
+    return str(data)
+
+
+class IngredientDataRenderer(renderers.BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    stream() отдает документ по частям из итератора строк
+    (название, количество, единица измерения), поэтому ответ можно
+    отправлять через StreamingHttpResponse, не собирая его в памяти.
+    По умолчанию это простые строки с полями через пробел.
+    """
+    charset = 'utf-8'
+
+    def stream(self, rows):
+        for values in chain((INGREDIENT_DATA_FILE_HEADERS,), rows):
+            yield ' '.join(str(value) for value in values) + '\n'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if isinstance(data, dict) or getattr(response, 'exception', False):
+            # Ошибки DRF (401, 404) приходят словарем, а не строками списка.
+            return self.render_detail(get_detail(data))
+        rows = (
+            tuple(row.values()) if isinstance(row, dict) else row
+            for row in data
+        )
+        chunks = self.stream(rows)
+        if self.charset is None:
+            return b''.join(chunks)
+        return ''.join(chunks)
+
+    def render_detail(self, message):
+        return f'{message}\n'
+
+
+class IngredientDataRendererTXT(IngredientDataRenderer):
     media_type = 'text/plain'
     format = 'txt'
 
-    def render(self, data, accepted_media_type=None, renderer_context=None):
-        text_buffer = io.StringIO()
-        text_buffer.write(
+    def stream(self, rows):
+        yield (
             '''
 _________________________________________________________________
 |    _____                    _                                 |
@@ -23,15 +74,85 @@ _________________________________________________________________
 |_______________________________________________________________|
 '''
         )
-        text_buffer.write(
-            ' '.join(header for header in INGREDIENT_DATA_FILE_HEADERS) + '\n')
-
-        for ingredient_data in data:
-            text_buffer.write(
-                ' '.join(str(i) for i in list(ingredient_data.values()))
-                + '\n')
-        text_buffer.write('_' * 65 + '\n')
-        text_buffer.write(f'{"Большое спасибо за использование": ^65} \n'
-                          + f'{"приложения Foodgram ©": ^65} \n')
-        text_buffer.write('_' * 65 + '\n')
-        return text_buffer.getvalue()
+        yield from super().stream(rows)
+        yield '_' * 65 + '\n'
+        yield (f'{"Большое спасибо за использование": ^65} \n'
+               + f'{"приложения Foodgram ©": ^65} \n')
+        yield '_' * 65 + '\n'
+
+
+class IngredientDataRendererCSV(IngredientDataRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        line = io.StringIO()
+        writer = csv.writer(line)
+        # BOM нужен, чтобы Excel распознал кириллицу в UTF-8
+        yield '\ufeff'
+        for values in chain((INGREDIENT_DATA_FILE_HEADERS,), rows):
+            writer.writerow(values)
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+
+
+class IngredientDataRendererPDF(IngredientDataRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    margin = 50
+
+    def get_font(self):
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        try:
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.PDF_FONT_PATH))
+        except (OSError, TTFError):
+            return 'Helvetica'
+        return self.font_name
+
+    def stream(self, rows):
+        # PDF нельзя отдать до записи таблицы ссылок в конце файла, поэтому
+        # документ пишется во временный файл, который сбрасывается на диск
+        # после STREAM_CHUNK_SIZE байт, и затем отдается частями.
+        with tempfile.SpooledTemporaryFile(
+                max_size=STREAM_CHUNK_SIZE) as buffer:
+            self.draw(buffer, rows)
+            buffer.seek(0)
+            while True:
+                chunk = buffer.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def render_detail(self, message):
+        buffer = io.BytesIO()
+        document = canvas.Canvas(buffer, pagesize=A4)
+        document.setFont(self.get_font(), self.font_size)
+        document.drawString(self.margin, A4[1] - self.margin, message)
+        document.save()
+        return buffer.getvalue()
+
+    def draw(self, buffer, rows):
+        font = self.get_font()
+        width, height = A4
+        document = canvas.Canvas(buffer, pagesize=A4)
+        line_height = self.font_size * 1.5
+        y = height - self.margin
+        document.setFont(font, self.font_size + 4)
+        document.drawString(self.margin, y, 'Foodgram: список покупок')
+        y -= line_height * 2
+        for name, amount, unit in chain((INGREDIENT_DATA_FILE_HEADERS,), rows):
+            if y < self.margin:
+                document.showPage()
+                y = height - self.margin
+            document.setFont(font, self.font_size)
+            document.drawString(self.margin, y, str(name))
+            document.drawRightString(width - 150, y, str(amount))
+            document.drawString(width - 140, y, str(unit))
+            y -= line_height
+        document.save()
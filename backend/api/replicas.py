@@ -0,0 +1,128 @@
+"""Чтение из реплик базы данных (DATABASE_REPLICAS) с read-your-writes.
+
+replica_middleware разрешает реплики только для безопасных запросов к API.
+Все остальные запросы, а также код вне запроса (команды, сигналы, фоновые
+потоки) работают с primary. После успешного изменяющего запроса
+пользователь на REPLICA_PIN_SECONDS секунд закрепляется за primary, чтобы
+сразу видеть свои избранное, корзину, подписки и правки рецептов.
+Отметка хранится в кеше по умолчанию, который должен быть общим для всех
+воркеров (см. api.cache.require_shared_cache).
+
+Данные, которые сохраняются в кешах дольше одного запроса (справочники,
+ответы для анонимов), читаются из primary через use_primary(): иначе
+отставшая реплика закрепила бы устаревшие данные под новой версией.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import LazyObject, empty
+
+API_PREFIX = '/api/'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Аутентификация и сессии всегда читаются из primary: отставшая реплика не
+# должна принимать токен, удаленный при выходе.
+PRIMARY_APP_LABELS = {'admin', 'auth', 'authtoken', 'contenttypes',
+                      'sessions'}
+
+replica_request = ContextVar('replica_request', default=None)
+
+
+def get_pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin(user_id):
+    cache.set(get_pin_key(user_id), 1, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+def get_known_user(request):
+    """Пользователь запроса, если он уже определен, без запросов к базе."""
+    user = request.__dict__.get('user')
+    if isinstance(user, LazyObject):
+        return None if user._wrapped is empty else user._wrapped
+    return user
+
+
+def is_pinned(request):
+    if not hasattr(request, '_db_pinned'):
+        user = get_known_user(request)
+        if user is None:
+            return False
+        request._db_pinned = user.is_authenticated and (
+            cache.get(get_pin_key(user.pk)) is not None)
+    return request._db_pinned
+
+
+@contextmanager
+def use_primary():
+    token = replica_request.set(None)
+    try:
+        yield
+    finally:
+        replica_request.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        request = replica_request.get()
+        if (request is None
+                or model._meta.app_label in PRIMARY_APP_LABELS
+                or is_pinned(request)):
+            return DEFAULT_DB_ALIAS
+        # Одна реплика на весь запрос: ответ собирается из одного снимка.
+        if not hasattr(request, '_db_replica'):
+            request._db_replica = random.choice(settings.DATABASE_REPLICAS)
+        return request._db_replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def enter(request):
+    use_replicas = (settings.DATABASE_REPLICAS
+                    and request.method in SAFE_METHODS
+                    and request.path.startswith(API_PREFIX))
+    return replica_request.set(request if use_replicas else None)
+
+
+def pin_writer(request, response):
+    if request.method in SAFE_METHODS or response.status_code >= 400:
+        return
+    user = get_known_user(request)
+    if user is not None and user.is_authenticated:
+        pin(user.pk)
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = enter(request)
+            try:
+                response = await get_response(request)
+            finally:
+                replica_request.reset(token)
+            pin_writer(request, response)
+            return response
+    else:
+        def middleware(request):
+            token = enter(request)
+            try:
+                response = get_response(request)
+            finally:
+                replica_request.reset(token)
+            pin_writer(request, response)
+            return response
+    return middleware
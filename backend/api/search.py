@@ -0,0 +1,88 @@
+from bisect import bisect_left
+
+from api.reference import ReferenceData
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import DatabaseError, connection
+from django.db.models import CharField, Q
+from django.db.models.lookups import PatternLookup
+from recipes.models import Ingredient
+
+
+@CharField.register_lookup
+class ILikeContains(PatternLookup):
+    """Подстрока без учета регистра через ILIKE (только PostgreSQL).
+
+    icontains на PostgreSQL компилируется в UPPER(name) LIKE UPPER(%s), и
+    GIN-индекс (name gin_trgm_ops) его не обслуживает. ILIKE по самой
+    колонке индекс использует.
+    """
+    lookup_name = 'ilike_contains'
+
+    def get_rhs_op(self, connection, rhs):
+        return f'ILIKE {rhs}'
+
+
+def similar_by_name(queryset, query):
+    """Поиск по названию с допуском опечаток.
+
+    На PostgreSQL используется pg_trgm: результаты ранжируются по
+    сходству, а ILIKE и оператор % используют GIN-индексы из миграции 0008.
+    На других СУБД (например, SQLite в тестах) выполняется обычный
+    icontains.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.filter(name__icontains=query)
+    return queryset.annotate(
+        similarity=TrigramSimilarity('name', query)
+    ).filter(
+        Q(name__ilike_contains=query)
+        | Q(name__trigram_similar=query)
+    ).order_by('-similarity', 'name')
+
+
+def load_ingredient_index():
+    rows = sorted(
+        Ingredient.objects.values('id', 'name', 'measurement_unit'),
+        key=lambda row: (row['name'].lower(), row['id']))
+    return {
+        'keys': [row['name'].lower() for row in rows],
+        'rows': rows,
+        'by_id': {row['id']: row for row in rows},
+    }
+
+
+class IngredientIndex(ReferenceData):
+    """Отсортированный в памяти каталог ингредиентов для автодополнения.
+
+    Сначала возвращаются совпадения по префиксу (бинарный поиск по
+    отсортированным ключам), затем совпадения по подстроке.
+    """
+
+    def warm(self):
+        try:
+            self.get()
+        except DatabaseError:
+            pass
+
+    def search(self, query='', limit=None):
+        data = self.get()
+        keys, rows = data['keys'], data['rows']
+        query = query.lower()
+        if not query:
+            return rows[:limit]
+        result = []
+        position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            result.append(rows[position])
+            if limit and len(result) >= limit:
+                return result
+            position += 1
+        for key, row in zip(keys, rows):
+            if query in key and not key.startswith(query):
+                result.append(row)
+                if limit and len(result) >= limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientIndex('ingredients', load_ingredient_index)
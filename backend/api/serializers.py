@@ -1,11 +1,16 @@
 import base64
 
 import djoser.serializers
+from api.reference import tag_reference
+from api.search import ingredient_index
+from api.uploads import check_image_dimensions, check_image_size
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
-from django.db.models import F
+from django.core.files.storage import default_storage
+from django.db.models import Case, Value, When
 from django.db.transaction import atomic
+from recipes import shopping_list
 from recipes.models import (Favorites, Ingredient, IngredientAmount, Recipe,
                             ShoppingCart, Subscriptions, Tag)
 from rest_framework import serializers, status
@@ -14,6 +19,37 @@ from rest_framework.exceptions import ValidationError
 User = get_user_model()
 
 
+def get_subscribed_ids(request):
+    # Один запрос на весь ответ: множество кешируется на объекте запроса.
+    if not hasattr(request, '_subscribed_ids'):
+        user = request.user
+        if user.is_anonymous:
+            request._subscribed_ids = frozenset()
+        else:
+            request._subscribed_ids = frozenset(
+                Subscriptions.objects.filter(user=user).values_list(
+                    'author_id', flat=True))
+    return request._subscribed_ids
+
+
+async def aget_subscribed_ids(request):
+    if not hasattr(request, '_subscribed_ids'):
+        user = request.user
+        if user.is_anonymous:
+            request._subscribed_ids = frozenset()
+        else:
+            request._subscribed_ids = frozenset([
+                author_id async for author_id in
+                Subscriptions.objects.filter(user=user).values_list(
+                    'author_id', flat=True)])
+    return request._subscribed_ids
+
+
+def reset_subscribed_ids(request):
+    if hasattr(request, '_subscribed_ids'):
+        del request._subscribed_ids
+
+
 class ErrorMessage:
     ALREADY_FOLLOWED_ERROR = {'errors': 'Вы уже подписаны '
                               + 'на этого пользователя'}
@@ -25,6 +61,10 @@ class ErrorMessage:
     ALREADY_INGREDIENT_ERROR = {'errors': 'Нельзя добавлять '
                                 + 'одинаковые ингредиенты'}
     ID_MSG_ERROR = {'id': 'id элемента, не может быть отрицательным'}
+    TAG_NOT_FOUND_ERROR = {'tags': 'Тег не найден'}
+    INGREDIENT_NOT_FOUND_ERROR = {'ingredients': 'Ингредиент не найден'}
+    IMAGE_PATH_ERROR = ('Путь к картинке должен быть относительным '
+                        + 'путем внутри MEDIA_ROOT')
 
 
 class UserCreateSerializer(djoser.serializers.UserCreateSerializer):
@@ -58,28 +98,44 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, obj):
-        user_id = obj.id
-        request_user = self.context.get('request').user.id
-        return Subscriptions.objects.filter(author=user_id,
-                                            user=request_user).exists()
-
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in get_subscribed_ids(self.context.get('request'))
+
+
+class ImageVariantsMixin:
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        urls = {}
+        for name, path in obj.image_variants.items():
+            if name == 'source':
+                continue
+            url = default_storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class ShortRecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField(
+        method_name='get_image_variants'
+    )
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = (
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time',
         )
 
 
 class UserSubSerializer(UserSerializer, ErrorMessage):
-    recipes_count = serializers.SerializerMethodField(
-        method_name='get_recipes_count'
+    recipes_count = serializers.IntegerField(read_only=True)
+    recipes = serializers.SerializerMethodField(
+        method_name='get_recipes'
     )
-    recipes = ShortRecipeSerializer(many=True, read_only=True)
     is_subscribed = serializers.SerializerMethodField(
         method_name='get_is_subscribed'
     )
@@ -119,8 +175,13 @@ class UserSubSerializer(UserSerializer, ErrorMessage):
             )
         return data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    def get_recipes(self, obj):
+        recipes = obj.recipes.all()
+        limit = self.context.get('recipes_limit')
+        if limit:
+            recipes = recipes[:limit]
+        return ShortRecipeSerializer(
+            recipes, many=True, context=self.context).data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -130,16 +191,26 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
+    """Картинка строкой data:image/...;base64 или файлом из multipart."""
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
+            check_image_size(len(imgstr) * 3 // 4)
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+        if hasattr(data, 'seek'):
+            check_image_size(data.size)
+            check_image_dimensions(data)
         return super().to_internal_value(data)
 
 
-class RecipeSerializer(serializers.ModelSerializer, ErrorMessage):
+class RecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer,
+                       ErrorMessage):
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField(
+        method_name='get_image_variants'
+    )
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = serializers.SerializerMethodField(
@@ -163,28 +234,41 @@ class RecipeSerializer(serializers.ModelSerializer, ErrorMessage):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
-    def __is_user_anonymous(self, obj, model):
+    def __is_user_anonymous(self, obj, model, annotation):
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return model.objects.filter(recipe=obj, user=user).exists()
 
     def get_ingredients(self, obj):
-        return obj.ingredient.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredient_amount__amount'))
+        amounts = obj.ingredient_amount.all()
+        if 'ingredient_amount' not in getattr(
+                obj, '_prefetched_objects_cache', {}):
+            # Ответ на создание и изменение рецепта: без prefetch.
+            amounts = amounts.select_related('ingredient')
+        return [
+            {
+                'id': amount.ingredient.id,
+                'name': amount.ingredient.name,
+                'measurement_unit': amount.ingredient.measurement_unit,
+                'amount': amount.amount,
+            }
+            for amount in amounts
+        ]
 
     def get_is_favorited(self, obj):
-        return self.__is_user_anonymous(obj, Favorites)
+        return self.__is_user_anonymous(obj, Favorites, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.__is_user_anonymous(obj, ShoppingCart)
+        return self.__is_user_anonymous(
+            obj, ShoppingCart, 'is_in_shopping_cart')
 
     def validate_cooking_time(self, data):
         if data < settings.MIN_TIME_COOKING:
@@ -207,6 +291,17 @@ class RecipeSerializer(serializers.ModelSerializer, ErrorMessage):
         if errors:
             raise serializers.ValidationError(errors)
 
+        self.check_ingredients(ingredients)
+        if tag_reference.missing_ids(map(int, tags)):
+            raise serializers.ValidationError(self.TAG_NOT_FOUND_ERROR)
+        data.update({
+            'tags': tags,
+            'ingredients': ingredients,
+        }
+        )
+        return data
+
+    def check_ingredients(self, ingredients):
         for ingredient in ingredients:
             if int(ingredient['amount']) < settings.MIN_AMOUNT:
                 raise serializers.ValidationError(self.MIN_AMOUNT_ERROR)
@@ -217,29 +312,37 @@ class RecipeSerializer(serializers.ModelSerializer, ErrorMessage):
         if len(ingredients) != len(set(ingredients_ids)):
             raise serializers.ValidationError(
                 self.ALREADY_INGREDIENT_ERROR)
-        data.update({
-            'tags': tags,
-            'ingredients': ingredients,
-        }
-        )
-        return data
+        if ingredient_index.missing_ids(map(int, ingredients_ids)):
+            raise serializers.ValidationError(
+                self.INGREDIENT_NOT_FOUND_ERROR)
+
+    def set_ingredients(self, recipe, ingredients, old_amounts):
+        """Приводит состав рецепта к ingredients, меняя только разницу."""
+        amounts = {int(ingredient['id']): int(ingredient['amount'])
+                   for ingredient in ingredients}
+        removed = old_amounts.keys() - amounts.keys()
+        if removed:
+            IngredientAmount.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = {pk: amount for pk, amount in amounts.items()
+                   if pk in old_amounts and old_amounts[pk] != amount}
+        if changed:
+            IngredientAmount.objects.filter(
+                recipe=recipe, ingredient_id__in=changed).update(
+                amount=Case(*(When(ingredient_id=pk, then=Value(amount))
+                              for pk, amount in changed.items())))
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items() if pk not in old_amounts)
+        return amounts
 
     @atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.save()
-        objects = []
-        for ingredient in ingredients:
-            ingredient = objects.append(IngredientAmount(
-                recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
-                amount=ingredient['amount'],
-            ))
-        IngredientAmount.objects.bulk_create(objects)
-        for tag in tags:
-            recipe.tags.add(tag)
+        self.set_ingredients(recipe, ingredients, {})
+        recipe.tags.add(*tags)
         return recipe
 
     @atomic
@@ -249,17 +352,10 @@ class RecipeSerializer(serializers.ModelSerializer, ErrorMessage):
         for field, value in validated_data.items():
             if hasattr(instance, field):
                 setattr(instance, field, value)
-        objects = []
-        instance.ingredient.clear()
-        for ingredient in ingredients:
-            ingredient = objects.append(IngredientAmount(
-                recipe=instance,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
-                amount=ingredient['amount'],
-            ))
-        IngredientAmount.objects.bulk_create(objects)
-        for tag in tags:
-            instance.tags.add(tag)
+        old_amounts = shopping_list.get_amounts(instance)
+        amounts = self.set_ingredients(instance, ingredients, old_amounts)
+        shopping_list.change_recipe(instance, old_amounts, amounts)
+        instance.tags.set(tags)
         instance.save()
         return instance
 
@@ -280,3 +376,36 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
             'amount',
             'measurement_unit'
         )
+
+
+class ImportIngredientSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    measurement_unit = serializers.CharField(max_length=200)
+    amount = serializers.IntegerField(min_value=settings.MIN_AMOUNT,
+                                      max_value=32767)
+
+
+class RecipeImportSerializer(serializers.Serializer, ErrorMessage):
+    """Строка NDJSON-загрузки рецептов (см. api.bulk)."""
+    author = serializers.EmailField(required=False)
+    name = serializers.CharField(max_length=200)
+    text = serializers.CharField(max_length=5000)
+    cooking_time = serializers.IntegerField(
+        min_value=settings.MIN_TIME_COOKING, max_value=32767)
+    pub_date = serializers.DateTimeField(required=False)
+    image = serializers.CharField(max_length=100, required=False,
+                                  allow_blank=True)
+    tags = serializers.ListField(child=serializers.SlugField(),
+                                 allow_empty=False)
+    ingredients = ImportIngredientSerializer(many=True, allow_empty=False)
+
+    def validate_image(self, value):
+        if value.startswith('/') or '..' in value.split('/'):
+            raise serializers.ValidationError(self.IMAGE_PATH_ERROR)
+        return value
+
+    def validate_ingredients(self, value):
+        pairs = {(item['name'], item['measurement_unit']) for item in value}
+        if len(pairs) != len(value):
+            raise serializers.ValidationError(self.ALREADY_INGREDIENT_ERROR)
+        return value
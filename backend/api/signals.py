@@ -0,0 +1,90 @@
+from api.authentication import get_auth_version_name
+from api.cache import bump_recipes_version, bump_version
+from api.instrumentation import record_query
+from api.reference import tag_reference
+from api.search import ingredient_index
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.images import variants_generated
+from recipes.models import (Favorites, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Subscriptions, Tag)
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+
+@receiver(connection_created)
+def instrument_connection(connection, **kwargs):
+    if (settings.QUERY_INSTRUMENTATION
+            and record_query not in connection.execute_wrappers):
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientAmount)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(variants_generated, sender=Recipe)
+def invalidate_recipes_cache(**kwargs):
+    bump_recipes_version()
+
+
+@receiver(post_save, sender=User)
+def invalidate_recipes_cache_on_author_change(instance, update_fields=None,
+                                              **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_recipes_version()
+    bump_version(f'user:{instance.pk}')
+    bump_version(get_auth_version_name(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+@receiver(post_delete, sender=User)
+def invalidate_cached_token(instance, **kwargs):
+    user_id = instance.user_id if isinstance(instance, Token) else instance.pk
+    bump_version(get_auth_version_name(user_id))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_cached_permissions(instance, pk_set, reverse, **kwargs):
+    user_ids = (pk_set or ()) if reverse else (instance.pk,)
+    for user_id in user_ids:
+        bump_version(get_auth_version_name(user_id))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_cached_group_permissions(instance, reverse, **kwargs):
+    if reverse:
+        return
+    for user_id in instance.user_set.values_list('pk', flat=True):
+        bump_version(get_auth_version_name(user_id))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(**kwargs):
+    tag_reference.invalidate()
+    bump_version('tags')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    bump_version('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Favorites)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscriptions)
+def bump_user_version(instance, **kwargs):
+    bump_version(f'user:{instance.user_id}')
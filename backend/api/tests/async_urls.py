@@ -0,0 +1,7 @@
+from api.async_views import wrap_async_reads
+from api.urls import router
+from django.urls import include, path
+
+urlpatterns = [
+    path('api/', include(wrap_async_reads(router.urls))),
+]
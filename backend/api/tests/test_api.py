@@ -1,16 +1,21 @@
+import shutil
+import tempfile
 from collections import OrderedDict
 from datetime import datetime
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from recipes.models import (Ingredient, IngredientAmount, Recipe, ShoppingCart,
                             Tag)
 from rest_framework.test import APIClient
 
 User = get_user_model()
 
+MEDIA_ROOT = tempfile.mkdtemp()
 
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class ApiURLTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -59,6 +64,11 @@ class ApiURLTests(TestCase):
         cls.recipe.ingredient.add(cls.ingredient)
         cls.recipe.tags.add(cls.tag)
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
     def setUp(self):
         self.auth_follower = APIClient()
         self.auth_follower.force_authenticate(self.user)
@@ -113,22 +123,39 @@ class ApiURLTests(TestCase):
         post = self.auth_follower.post(
             f'/api/recipes/{self.recipe_second.pk}/shopping_cart/')
         self.assertEqual(post.status_code, HTTPStatus.CREATED)
-        self.assertEqual(len(post.data), 4)
+        self.assertEqual(len(post.data), 5)
         self.assertEqual(
             post.data, {'id': 2, 'name': 'Тестовый рецепт второй',
                         'image': '/media/default.jpg',
+                        'image_variants': {},
                         'cooking_time': 35})
 
     def test_get_shopping_card(self):
         response = self.auth_follower.get(
             '/api/recipes/download_shopping_cart/'
         )
+        content = b''.join(response.streaming_content).decode()
         self.assertEqual(response.status_code, HTTPStatus.OK)
-        self.assertIn('Тестовый ингредиент', str(response.data))
-        self.assertIn('100', str(response.data))
+        self.assertIn('Тестовый ингредиент', content)
+        self.assertIn('100', content)
         self.assertIn('attachment', str(response.headers))
         self.assertIn('"foodgram_shopping_cart.txt"', str(response.headers))
 
+    def test_get_shopping_card_formats(self):
+        for suffix, media_type, marker in (
+                ('csv', 'text/csv', b'100'),
+                ('pdf', 'application/pdf', b'%PDF')):
+            with self.subTest(suffix=suffix):
+                response = self.auth_follower.get(
+                    f'/api/recipes/download_shopping_cart.{suffix}/')
+                content = b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertTrue(response['Content-Type'].startswith(
+                    media_type))
+                self.assertIn(marker, content)
+                self.assertIn(f'foodgram_shopping_cart.{suffix}',
+                              response['Content-Disposition'])
+
     def test_shopping_cart_delete(self):
         delete = self.auth_follower.delete(
             f'/api/recipes/{self.recipe.pk}/shopping_cart/')
@@ -140,11 +167,12 @@ class ApiURLTests(TestCase):
             f'/api/recipes/{self.recipe.pk}/favorite/'
         )
         self.assertEqual(post.status_code, HTTPStatus.CREATED)
-        self.assertEqual(len(post.data), 4)
+        self.assertEqual(len(post.data), 5)
         self.assertEqual(post.data, {'id': 1,
                                      'name':
                                      'Тестовый рецепт',
                                      'image': '/media/default.jpg',
+                                     'image_variants': {},
                                      'cooking_time': 30})
         delete = self.auth_follower.delete(
             f'/api/recipes/{self.recipe.pk}/favorite/'
@@ -167,10 +195,12 @@ class ApiURLTests(TestCase):
              [OrderedDict([('id', 1),
                            ('name', 'Тестовый рецепт'),
                            ('image', 'http://testserver/media/default.jpg'),
+                           ('image_variants', {}),
                            ('cooking_time', 30)]),
               OrderedDict([('id', 2),
                           ('name', 'Тестовый рецепт второй'),
                           ('image', 'http://testserver/media/default.jpg'),
+                          ('image_variants', {}),
                           ('cooking_time', 35)])], 'recipes_count': 2})
         self.assertEqual(len(post.data), 8)
         self.assertEqual(post.status_code, HTTPStatus.CREATED)
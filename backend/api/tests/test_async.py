@@ -0,0 +1,126 @@
+import asyncio
+from http import HTTPStatus
+
+from api.async_views import RecipeDetailView
+from api.authentication import token_cache
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import resolve
+from recipes.models import (Favorites, Ingredient, IngredientAmount, Recipe,
+                            Subscriptions, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+
+@override_settings(ROOT_URLCONF='api.tests.async_urls',
+                   QUERY_BUDGET_STRICT=True)
+class AsyncReadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader',
+                                            email='reader@test.ru')
+        cls.author = User.objects.create_user(username='writer',
+                                              email='writer@test.ru')
+        cls.token = Token.objects.create(user=cls.user)
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}')
+            for i in range(2))
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Соль {i}', measurement_unit='г')
+            for i in range(3))
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=10)
+            recipe.tags.set(tags[:i % 2 + 1])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=ingredient,
+                                 amount=i + 1)
+                for ingredient in ingredients)
+        cls.recipe = recipe
+        Favorites.objects.create(user=cls.user, recipe=recipe)
+        Subscriptions.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_both(self, url):
+        cache.clear()
+        async_response = self.client.get(url)
+        cache.clear()
+        with override_settings(ROOT_URLCONF='foodgram.urls'):
+            sync_response = self.client.get(url)
+        return sync_response, async_response
+
+    def test_routes_are_async(self):
+        match = resolve(f'/api/recipes/{self.recipe.pk}/')
+        self.assertIs(match.func.view_class, RecipeDetailView)
+        self.assertTrue(asyncio.iscoroutinefunction(match.func))
+
+    def test_responses_match_sync_views(self):
+        urls = (
+            '/api/recipes/',
+            '/api/recipes/?limit=1&page=2',
+            '/api/recipes/?tags=tag1&is_favorited=1',
+            f'/api/recipes/?author={self.author.pk}&name=Рецепт',
+            f'/api/recipes/{self.recipe.pk}/',
+            '/api/users/subscriptions/?recipes_limit=2',
+            '/api/tags/',
+            f'/api/tags/{Tag.objects.first().pk}/',
+            '/api/ingredients/?name=со',
+            '/api/ingredients/?name=ль 2',
+        )
+        for anonymous in (False, True):
+            if anonymous:
+                self.client.credentials()
+            for url in urls:
+                with self.subTest(url=url, anonymous=anonymous):
+                    sync_response, async_response = self.get_both(url)
+                    if async_response.status_code == HTTPStatus.OK:
+                        # Заголовок Allow выставляет только view DRF.
+                        self.assertNotIn('Allow', async_response)
+                    self.assertEqual(async_response.status_code,
+                                     sync_response.status_code)
+                    self.assertEqual(async_response.json(),
+                                     sync_response.json())
+
+    def test_fallback_to_sync_views(self):
+        response = self.client.get('/api/recipes/?page=100')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.get('/api/recipes/?tags=unknown')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.client.post('/api/recipes/', {}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.client.get('/api/recipes/?cursor=&limit=1')
+        self.assertEqual(len(response.json()['results']), 1)
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        self.client.credentials()
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_conditional_get(self):
+        self.client.credentials()
+        url = f'/api/recipes/{self.recipe.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    async def test_async_client(self):
+        response = await self.async_client.get(
+            '/api/recipes/?is_favorited=1',
+            headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        recipe = response.json()['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['author']['is_subscribed'])
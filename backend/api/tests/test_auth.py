@@ -0,0 +1,151 @@
+import tempfile
+from http import HTTPStatus
+
+from api.authentication import token_cache
+from api.cache import require_shared_cache
+from api.tokens import StatelessJWTAuthentication
+from api.views import JWTViewSet, UserViewSet
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+User = get_user_model()
+
+
+class TokenCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader',
+                                            email='reader@test.ru')
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def count_queries(self, url='/api/users/me/'):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.queries = [query['sql'] for query in context.captured_queries]
+        return response.status_code, len(self.queries)
+
+    def test_cached_user_skips_auth_queries(self):
+        status, first = self.count_queries()
+        self.assertEqual(status, HTTPStatus.OK)
+        status, second = self.count_queries()
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertLess(second, first)
+        self.assertFalse([sql for sql in self.queries
+                          if 'authtoken_token' in sql or 'permission' in sql])
+        status, _ = self.count_queries('/api/users/')
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertFalse([sql for sql in self.queries
+                          if 'authtoken_token' in sql or 'permission' in sql])
+
+    def test_logout_invalidates_token(self):
+        self.count_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        status, _ = self.count_queries()
+        self.assertEqual(status, HTTPStatus.UNAUTHORIZED)
+
+    @override_settings(AUTH_TOKEN_LOCAL_CACHE_TTL=0)
+    def test_local_cache_expires_quickly(self):
+        self.count_queries()
+        self.count_queries()
+        self.assertTrue([sql for sql in self.queries
+                         if 'authtoken_token' in sql])
+
+    def test_deactivation_invalidates_token(self):
+        self.count_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        status, _ = self.count_queries()
+        self.assertEqual(status, HTTPStatus.UNAUTHORIZED)
+
+
+class JWTTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='jwtuser', email='jwt@test.ru', password='Gsdfks5252')
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.me = UserViewSet.as_view(
+            {'get': 'me'},
+            authentication_classes=(StatelessJWTAuthentication,))
+
+    def call(self, action, data):
+        view = JWTViewSet.as_view({'post': action})
+        return view(self.factory.post('/', data, format='json'))
+
+    def get_me(self, access):
+        request = self.factory.get(
+            '/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.context = CaptureQueriesContext(connection)
+        with self.context:
+            return self.me(request)
+
+    def test_access_token_needs_no_user_query(self):
+        tokens = self.call('create_token', {'email': 'jwt@test.ru',
+                                            'password': 'Gsdfks5252'}).data
+        response = self.get_me(tokens['access'])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['username'], 'jwtuser')
+        self.assertFalse([query for query in self.context.captured_queries
+                          if 'users_customuser' in query['sql']])
+
+    def test_refresh_rotates_and_password_change_revokes(self):
+        tokens = self.call('create_token', {'email': 'jwt@test.ru',
+                                            'password': 'Gsdfks5252'}).data
+        rotated = self.call('refresh', {'refresh': tokens['refresh']})
+        self.assertEqual(rotated.status_code, HTTPStatus.OK)
+        reused = self.call('refresh', {'refresh': tokens['refresh']})
+        self.assertEqual(reused.status_code, HTTPStatus.UNAUTHORIZED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('Nkdjf83742')
+            self.user.save()
+        response = self.get_me(rotated.data['access'])
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        response = self.call('refresh', {'refresh': rotated.data['refresh']})
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_missing_refresh_token(self):
+        for data in ({}, {'refresh': ''}):
+            response = self.call('refresh', data)
+            self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+            request = self.factory.post('/', data, format='json')
+            force_authenticate(request, user=self.user)
+            response = JWTViewSet.as_view({'post': 'logout'})(request)
+            self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+
+
+class SharedCacheTests(SimpleTestCase):
+    @override_settings(AUTH_MODE='jwt')
+    def test_cache_state_requires_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            require_shared_cache()
+        with override_settings(AUTH_MODE='token',
+                               DATABASE_REPLICAS=['replica1']):
+            with self.assertRaises(ImproperlyConfigured):
+                require_shared_cache()
+        with tempfile.TemporaryDirectory() as location, override_settings(
+                CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.'
+                               'FileBasedCache',
+                    'LOCATION': location}}):
+            require_shared_cache()
@@ -0,0 +1,683 @@
+import json
+import shutil
+import tempfile
+import warnings
+from base64 import b64encode
+from http import HTTPStatus
+from io import BytesIO, StringIO
+
+from api.instrumentation import QueryBudgetError, query_stats_middleware
+from api.search import ingredient_index
+from api.serializers import RecipeSerializer
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from recipes.images import generate_variants
+from recipes.models import (Favorites, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, ShoppingListItem, Subscriptions, Tag)
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader',
+                                            email='reader@test.ru')
+        cls.author = User.objects.create_user(username='writer',
+                                              email='writer@test.ru')
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}')
+            for i in range(3))
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(5))
+        Subscriptions.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count):
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10,
+            )
+            recipe.tags.set(self.tags)
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=ingredient,
+                                 amount=10)
+                for ingredient in self.ingredients)
+            Favorites.objects.create(user=self.user, recipe=recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(context.captured_queries)
+
+    def test_recipe_list_queries_do_not_grow(self):
+        """Число запросов ленты рецептов не зависит от размера страницы."""
+        self.create_recipes(2)
+        small = self.count_queries('/api/recipes/?limit=999')
+        self.create_recipes(10)
+        large = self.count_queries('/api/recipes/?limit=999')
+        self.assertEqual(small, large)
+
+    def test_recipe_keyset_pagination(self):
+        self.create_recipes(7)
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+        url, seen, queries = '/api/recipes/?cursor=&limit=3', [], []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            queries.append(len(context.captured_queries))
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            seen.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(set(queries)), 1)
+
+    def test_recipe_list_flags(self):
+        self.create_recipes(1)
+        response = self.client.get('/api/recipes/?is_favorited=1')
+        recipe = response.data['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertEqual(len(recipe['ingredients']), 5)
+        self.assertEqual(len(recipe['tags']), 3)
+
+    def test_user_list_queries_do_not_grow(self):
+        """Подписки пользователя загружаются один раз на весь ответ."""
+        small = self.count_queries('/api/users/?limit=999')
+        User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@test.ru')
+            for i in range(10))
+        large = self.count_queries('/api/users/?limit=999')
+        self.assertEqual(small, large)
+
+    def test_subscriptions_recipes_limit(self):
+        self.create_recipes(4)
+        small = self.count_queries('/api/users/subscriptions/?recipes_limit=2')
+        response = self.client.get('/api/users/subscriptions/?recipes_limit=2')
+        author = response.data['results'][0]
+        self.assertEqual(author['recipes_count'], 4)
+        self.assertEqual(
+            [recipe['name'] for recipe in author['recipes']],
+            ['Рецепт 3', 'Рецепт 2'])
+        self.create_recipes(4)
+        large = self.count_queries('/api/users/subscriptions/?recipes_limit=2')
+        self.assertEqual(small, large)
+
+    def test_subscriptions_ordered(self):
+        other = User.objects.create_user(username='other',
+                                         email='other@test.ru')
+        Subscriptions.objects.create(user=self.user, author=other)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(
+            [author['id'] for author in response.data['results']],
+            [other.pk, self.author.pk])
+
+
+class IngredientSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('сахарная пудра', 'ванильный сахар', 'сахар',
+                         'соль'))
+
+    def setUp(self):
+        ingredient_index.invalidate()
+
+    def test_prefix_matches_first(self):
+        response = self.client.get('/api/ingredients/?name=сахар')
+        self.assertEqual(
+            [row['name'] for row in response.data],
+            ['сахар', 'сахарная пудра', 'ванильный сахар'])
+
+    def test_limit_and_no_queries(self):
+        self.client.get('/api/ingredients/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/?name=с&limit=2')
+        self.assertEqual(len(response.data), 2)
+
+    def test_rebuilt_on_change(self):
+        self.client.get('/api/ingredients/')
+        Ingredient.objects.create(name='сахарин', measurement_unit='г')
+        response = self.client.get('/api/ingredients/?name=сахари')
+        self.assertEqual([row['name'] for row in response.data], ['сахарин'])
+
+    @override_settings(REFERENCE_DATA_CHECK_INTERVAL=0)
+    def test_rebuilt_after_fill_db(self):
+        self.client.get('/api/ingredients/')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('fill_db', 'ingredients.csv', '--upsert',
+                         stdout=StringIO())
+        self.assertEqual(ingredient_index.search('абрикосовое')[0]['name'],
+                         'абрикосовое варенье')
+
+    def test_recipe_name_filter(self):
+        response = self.client.get('/api/recipes/?name=нет такого')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['count'], 0)
+
+
+class ShoppingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer',
+                                            email='buyer@test.ru')
+        cls.salt = Ingredient.objects.create(name='соль',
+                                             measurement_unit='г')
+        cls.sugar = Ingredient.objects.create(name='сахар',
+                                              measurement_unit='г')
+        cls.recipes = [
+            Recipe.objects.create(author=cls.user, name=f'Рецепт {i}',
+                                  text='Описание', cooking_time=5)
+            for i in range(2)]
+        for recipe in cls.recipes:
+            IngredientAmount.objects.create(recipe=recipe,
+                                            ingredient=cls.salt, amount=5)
+        IngredientAmount.objects.create(recipe=cls.recipes[1],
+                                        ingredient=cls.sugar, amount=7)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user).values_list('ingredient__name', 'amount'))
+
+    def test_cart_changes_update_aggregate(self):
+        for recipe in self.recipes:
+            self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assertEqual(self.get_list(), {'соль': 10, 'сахар': 7})
+        self.client.delete(f'/api/recipes/{self.recipes[1].pk}/'
+                           'shopping_cart/')
+        self.assertEqual(self.get_list(), {'соль': 5})
+        self.recipes[0].delete()
+        self.assertEqual(self.get_list(), {})
+
+    def test_recipe_update_changes_aggregate(self):
+        recipe = self.recipes[0]
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        tag = Tag.objects.create(name='обед', color='#000000', slug='lunch')
+        serializer = RecipeSerializer(
+            recipe,
+            data={'name': recipe.name, 'text': recipe.text,
+                  'cooking_time': 5, 'tags': [tag.pk],
+                  'ingredients': [{'id': self.sugar.pk, 'amount': 3}]},
+            partial=True,
+            context={'request': None})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(self.get_list(), {'сахар': 3})
+        ShoppingListItem.objects.all().delete()
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(self.get_list(), {'сахар': 3})
+
+    def test_anonymous_download_is_unauthorized(self):
+        detail = 'Учетные данные не были предоставлены.'
+        for suffix in ('txt', 'csv', 'pdf'):
+            with self.subTest(suffix=suffix):
+                response = APIClient().get(
+                    f'/api/recipes/download_shopping_cart.{suffix}/')
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.UNAUTHORIZED)
+                if suffix == 'pdf':
+                    self.assertTrue(response.content.startswith(b'%PDF'))
+                else:
+                    self.assertEqual(response.content.decode(),
+                                     f'{detail}\n')
+
+
+class AnonymousCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='cook',
+                                              email='cook@test.ru')
+        cls.recipe = Recipe.objects.create(author=cls.author, name='Суп',
+                                           text='Описание', cooking_time=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_list_is_cached_and_invalidated(self):
+        url = f'/api/recipes/?author={self.author.pk}&limit=6'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                f'/api/recipes/?limit=6&author={self.author.pk}')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Борщ'
+            self.recipe.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['name'], 'Борщ')
+
+    def test_conditional_get(self):
+        for url in ('/api/tags/', '/api/ingredients/',
+                    f'/api/recipes/{self.recipe.pk}/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(1 if 'recipes' in url else 0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertIn('Last-Modified', response)
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_reference_data_served_from_memory(self):
+        tag = Tag.objects.create(name='ужин', color='#111111', slug='dinner')
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/tags/{tag.pk}/')
+        self.assertEqual(response.data['slug'], 'dinner')
+        self.recipe.tags.add(tag)
+        response = self.client.get('/api/recipes/?tags=dinner')
+        self.assertEqual(response.data['count'], 1)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT,
+                   IMAGE_PIPELINE_BACKEND='recipes.images.SyncBackend')
+class ImageVariantsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def make_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200), 'orange').save(buffer, 'JPEG')
+        return SimpleUploadedFile('dish.jpg', buffer.getvalue(),
+                                  content_type='image/jpeg')
+
+    def test_variants_generated_after_commit(self):
+        user = User.objects.create_user(username='cook',
+                                        email='cook@test.ru')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=user, name='Пирог', text='Описание', cooking_time=5,
+                image=self.make_image())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants['source'], recipe.image.name)
+        with Image.open(
+                f'{MEDIA_ROOT}/{recipe.image_variants["thumbnail_webp"]}'
+        ) as variant:
+            self.assertEqual(variant.format, 'WEBP')
+            self.assertEqual(variant.size, (320, 240))
+
+        response = APIClient().get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(
+            set(response.data['image_variants']),
+            {'thumbnail', 'thumbnail_webp', 'card_webp'})
+        self.assertTrue(response.data['image_variants']['thumbnail']
+                        .startswith('http://testserver/media/'))
+
+    def test_variants_change_etag(self):
+        user = User.objects.create_user(username='cook',
+                                        email='cook@test.ru')
+        recipe = Recipe.objects.create(
+            author=user, name='Пирог', text='Описание', cooking_time=5,
+            image=self.make_image())
+        client = APIClient()
+        etag = client.get(f'/api/recipes/{recipe.pk}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_variants(recipe.pk)
+        response = client.get(f'/api/recipes/{recipe.pk}/',
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('thumbnail', response.data['image_variants'])
+
+    def test_default_image_skipped(self):
+        Image.new('RGB', (800, 600), 'white').save(
+            f'{MEDIA_ROOT}/default.jpg')
+        user = User.objects.create_user(username='cook',
+                                        email='cook@test.ru')
+        recipe = Recipe.objects.create(
+            author=user, name='Суп', text='Описание', cooking_time=5)
+        call_command('generate_image_variants', stdout=StringIO())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, {})
+        self.assertFalse(default_storage.exists('recipes/variants'))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MultipartUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='uploader',
+                                            email='uploader@test.ru')
+        cls.tag = Tag.objects.create(name='ужин', color='#000000',
+                                     slug='dinner')
+        cls.salt = Ingredient.objects.create(name='соль',
+                                             measurement_unit='г')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, size=(64, 48)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'green').save(buffer, 'PNG')
+        buffer.seek(0)
+        buffer.name = 'dish.png'
+        return self.client.post('/api/recipes/', {
+            'name': 'Салат', 'text': 'Описание', 'cooking_time': 10,
+            'tags': f'[{self.tag.pk}]',
+            'ingredients': f'[{{"id": {self.salt.pk}, "amount": 3}}]',
+            'image': buffer,
+        }, format='multipart')
+
+    def test_multipart_create(self):
+        response = self.post()
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertEqual(recipe.image.width, 64)
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=512)
+    def test_size_limit(self):
+        response = self.post(size=(2000, 2000))
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('image', response.data)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=1000)
+    def test_dimensions_limit(self):
+        response = self.post()
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class RecipeWriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='writer',
+                                            email='writer@test.ru')
+        cls.tags = [Tag.objects.create(name=f'тег {i}', color=f'#00000{i}',
+                                       slug=f'tag{i}') for i in range(3)]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(32))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def payload(self, ingredients, tags):
+        return {'name': 'Рагу', 'text': 'Описание', 'cooking_time': 40,
+                'tags': [tag.pk for tag in tags],
+                'ingredients': [{'id': ingredient.pk, 'amount': amount}
+                                for ingredient, amount in ingredients]}
+
+    def test_update_writes_only_difference(self):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        data = self.payload(
+            [(ingredient, 10) for ingredient in self.ingredients[:30]],
+            self.tags[:2])
+        data['image'] = ('data:image/png;base64,'
+                         + b64encode(buffer.getvalue()).decode())
+        with override_settings(MEDIA_ROOT=MEDIA_ROOT):
+            response = self.client.post('/api/recipes/', data,
+                                        format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        pk = response.data['id']
+        kept = IngredientAmount.objects.get(
+            recipe_id=pk, ingredient=self.ingredients[1]).pk
+
+        ingredients = (
+            [(self.ingredients[0], 25)]
+            + [(ingredient, 10) for ingredient in self.ingredients[1:29]]
+            + [(ingredient, 5) for ingredient in self.ingredients[30:]])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{pk}/',
+                self.payload(ingredients, self.tags[1:]), format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        writes = [query['sql'] for query in context.captured_queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE',
+                                              'DELETE'))]
+        self.assertLessEqual(len(writes), 7, writes)
+
+        amounts = dict(IngredientAmount.objects.filter(
+            recipe_id=pk).values_list('ingredient_id', 'amount'))
+        self.assertEqual(amounts, {ingredient.pk: amount
+                                   for ingredient, amount in ingredients})
+        self.assertTrue(IngredientAmount.objects.filter(pk=kept).exists())
+        self.assertEqual(
+            set(Recipe.objects.get(pk=pk).tags.all()), set(self.tags[1:]))
+
+
+class RecipeBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='admin', email='admin@test.ru', is_staff=True)
+        cls.tag = Tag.objects.create(name='завтрак', color='#00000A',
+                                     slug='breakfast')
+        cls.eggs = Ingredient.objects.create(name='яйца',
+                                             measurement_unit='шт')
+        recipe = Recipe.objects.create(author=cls.admin, name='Омлет',
+                                       text='Описание', cooking_time=10)
+        recipe.tags.add(cls.tag)
+        IngredientAmount.objects.create(recipe=recipe, ingredient=cls.eggs,
+                                        amount=3)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_export_import_round_trip(self):
+        response = self.client.get('/api/recipes/export/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"breakfast"', lines[0])
+
+        body = '\n'.join([
+            lines[0],
+            '{не json',
+            lines[0].replace('"breakfast"', '"dinner"'),
+            lines[0].replace('"cooking_time": 10', '"cooking_time": 0'),
+        ])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.generic(
+                'POST', '/api/recipes/import/', body.encode(),
+                content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']],
+                         [2, 3, 4])
+        self.assertLess(len(context.captured_queries), 15)
+        copy = Recipe.objects.exclude(pk=Recipe.objects.earliest('id').pk)
+        self.assertEqual(copy.get().ingredient_amount.get().amount, 3)
+        self.assertEqual(list(copy.get().tags.all()), [self.tag])
+
+    def test_bulk_requires_staff(self):
+        user = User.objects.create_user(username='guest',
+                                        email='guest@test.ru')
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/recipes/export/')
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='chef',
+                                              email='chef@test.ru')
+        cls.fan = User.objects.create_user(username='fan',
+                                           email='fan@test.ru')
+        cls.recipe = Recipe.objects.create(author=cls.author, name='Суп',
+                                           text='Описание', cooking_time=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def check_counters(self, **expected):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual({
+            'favorites': self.recipe.favorites_count,
+            'cart': self.recipe.shopping_cart_count,
+            'recipes': self.author.recipes_count,
+            'followers': self.author.followers_count,
+        }, expected)
+
+    def test_actions_update_counters(self):
+        self.check_counters(favorites=0, cart=0, recipes=1, followers=0)
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.post(url + 'favorite/')
+        self.client.post(url + 'shopping_cart/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.check_counters(favorites=1, cart=1, recipes=1, followers=1)
+
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.data['results'][0]['recipes_count'], 1)
+
+        self.client.delete(url + 'favorite/')
+        self.client.delete(url + 'shopping_cart/')
+        self.client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        Recipe.objects.create(author=self.author, name='Каша',
+                              text='Описание', cooking_time=5)
+        self.check_counters(favorites=0, cart=0, recipes=2, followers=0)
+
+    def test_reconcile_command(self):
+        Favorites.objects.bulk_create([
+            Favorites(user=self.fan, recipe=self.recipe)])
+        User.objects.filter(pk=self.author.pk).update(recipes_count=7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.check_counters(favorites=1, cart=0, recipes=1, followers=0)
+
+    def test_save_keeps_concurrent_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.client.post(f'/api/users/{author.pk}/subscribe/')
+        recipe.name = 'Борщ'
+        recipe.save()
+        author.first_name = 'Шеф'
+        author.save()
+        self.check_counters(favorites=1, cart=0, recipes=1, followers=1)
+        self.assertEqual(self.recipe.name, 'Борщ')
+        self.assertEqual(self.author.first_name, 'Шеф')
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryInstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@test.ru')
+            for i in range(6))
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('api.queries', 'INFO') as logs:
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotIn('Server-Timing', response)
+        staff = User.objects.create_user(username='staff',
+                                         email='staff@test.ru',
+                                         is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        self.assertRegex(client.get('/api/users/')['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], 'users-list')
+        self.assertEqual(record['status'], HTTPStatus.OK)
+        self.assertGreater(record['queries'], 0)
+
+    def test_repeated_queries_are_reported(self):
+        def view(request):
+            for user in self.users:
+                Subscriptions.objects.filter(user=user).exists()
+            return HttpResponse()
+
+        request = self.factory.get('/api/users/')
+        request.resolver_match = None
+        with self.assertLogs('api.queries', 'WARNING') as logs:
+            with override_settings(QUERY_BUDGET_STRICT=False):
+                query_stats_middleware(view)(request)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['repeated'][0]['count'], len(self.users))
+        with self.assertLogs('api.queries', 'WARNING'):
+            with self.assertRaises(QueryBudgetError):
+                query_stats_middleware(view)(request)
+
+    @override_settings(QUERY_BUDGETS={'GET users-list': 0})
+    def test_budget_fails_request(self):
+        with self.assertLogs('api.queries', 'WARNING'):
+            with self.assertRaisesMessage(QueryBudgetError, 'бюджете 0'):
+                self.client.get('/api/users/')
+
+
+class BenchmarkCommandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='bench', email='bench@test.ru')
+        Tag.objects.create(name='ужин', color='#000000', slug='dinner')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.baseline = f'{directory}/baseline.json'
+
+    def benchmark(self, *args):
+        call_command('benchmark', '--only', 'tags', '--iterations', '2',
+                     '--warmup', '0', *args, stdout=StringIO())
+
+    def test_save_baseline(self):
+        self.benchmark('--save', self.baseline)
+        with open(self.baseline, encoding='utf-8') as f:
+            result = json.load(f)
+        self.assertEqual(list(result), ['tags'])
+        self.assertEqual(set(result['tags']),
+                         {'p50', 'p95', 'p99', 'queries', 'bytes'})
+        self.assertGreater(result['tags']['bytes'], 0)
+
+    def test_compare_flags_regression(self):
+        self.benchmark('--save', self.baseline)
+        with open(self.baseline, encoding='utf-8') as f:
+            result = json.load(f)
+        for metric in ('p50', 'p95', 'p99'):
+            result['tags'][metric] *= 1000
+        result['tags']['bytes'] /= 2
+        with open(self.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        with self.assertRaisesMessage(CommandError, 'tags.bytes'):
+            self.benchmark('--compare', self.baseline)
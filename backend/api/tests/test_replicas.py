@@ -0,0 +1,66 @@
+from api.replicas import (ReplicaRouter, get_pin_key, replica_middleware,
+                          use_primary)
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader',
+                                            email='reader@test.ru')
+        cls.other = User.objects.create_user(username='other',
+                                             email='other@test.ru')
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def route(self, request, user=None, primary=False):
+        def view(request):
+            if user is not None:
+                # Так пользователя выставляет DRF после аутентификации.
+                request.user = user
+            if primary:
+                with use_primary():
+                    self.routes = self.router.db_for_read(Recipe)
+            else:
+                self.routes = (self.router.db_for_read(Recipe),
+                               self.router.db_for_read(Token))
+            return HttpResponse(
+                status=201 if request.method == 'POST' else 200)
+
+        replica_middleware(view)(request)
+        return self.routes
+
+    def test_safe_api_reads_use_replica(self):
+        request = self.factory.get('/api/recipes/')
+        self.assertEqual(self.route(request, AnonymousUser()),
+                         ('replica', 'default'))
+        self.assertEqual(self.route(self.factory.get('/admin/')),
+                         ('default', 'default'))
+        self.assertEqual(self.route(request, primary=True), 'default')
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_writer_is_pinned_to_primary(self):
+        url = '/api/recipes/'
+        self.assertEqual(
+            self.route(self.factory.get(url), self.user)[0], 'replica')
+        self.assertEqual(
+            self.route(self.factory.post(url), self.user)[0], 'default')
+        self.assertEqual(
+            self.route(self.factory.get(url), self.user)[0], 'default')
+        self.assertEqual(
+            self.route(self.factory.get(url), self.other)[0], 'replica')
+        cache.delete(get_pin_key(self.user.pk))
+        self.assertEqual(
+            self.route(self.factory.get(url), self.user)[0], 'replica')
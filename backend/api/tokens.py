@@ -0,0 +1,115 @@
+"""JWT-режим авторизации (AUTH_MODE = 'jwt' или 'both').
+
+Короткоживущий access-токен содержит поля пользователя и версию
+auth:<id пользователя>, поэтому проверяется без обращения к базе данных:
+достаточно подписи, срока действия и одного чтения общего кеша. Любое
+сохранение пользователя повышает версию, и клиент получает новую пару
+токенов по refresh-токену. Refresh-токен проверяется по базе и содержит
+хеш пароля, поэтому смена пароля или деактивация отзывают и его.
+
+Список отзыва компактен: в общем кеше хранятся только jti отозванных
+токенов и только до истечения их собственного срока действия.
+"""
+import time
+
+from api.authentication import get_auth_version_name
+from api.cache import get_versions
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import constant_time_compare
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+USER_CLAIMS = (
+    'username',
+    'email',
+    'first_name',
+    'last_name',
+    'is_staff',
+    'is_superuser',
+)
+REVOKED_TOKEN_ERROR = 'Токен отозван'
+MISSING_TOKEN_ERROR = 'Передайте refresh-токен'
+
+
+def get_revoked_key(jti):
+    return f'jwt:revoked:{jti}'
+
+
+def revoke(token):
+    remaining = token['exp'] - int(time.time())
+    if remaining > 0:
+        cache.set(get_revoked_key(token[api_settings.JTI_CLAIM]), 1,
+                  timeout=remaining)
+
+
+def is_revoked(token):
+    key = get_revoked_key(token[api_settings.JTI_CLAIM])
+    return cache.get(key) is not None
+
+
+class UserRefreshToken(RefreshToken):
+    no_copy_claims = RefreshToken.no_copy_claims + ('password_hash',)
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        name = get_auth_version_name(user.pk)
+        token['auth_version'] = get_versions(name)[name]
+        token['password_hash'] = user.get_session_auth_hash()
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+    @classmethod
+    def rotate(cls, raw_token):
+        """Проверяет refresh-токен по базе, отзывает его и выдает новый."""
+        # Token(None) не проверяет, а создает новый токен без утверждений.
+        if not raw_token:
+            raise InvalidToken(MISSING_TOKEN_ERROR)
+        try:
+            refresh = cls(raw_token)
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+        if is_revoked(refresh):
+            raise InvalidToken(REVOKED_TOKEN_ERROR)
+        user = User.objects.filter(
+            pk=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None or not constant_time_compare(
+                user.get_session_auth_hash(),
+                refresh.get('password_hash', '')):
+            raise InvalidToken(REVOKED_TOKEN_ERROR)
+        revoke(refresh)
+        return user, cls.for_user(user)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """Проверяет access-токен без запросов к базе данных.
+
+    request.user - экземпляр модели, собранный из утверждений токена;
+    остальные поля отложены (deferred) и загрузятся из базы только при
+    обращении к ним, а save() запишет лишь загруженные поля.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        name = get_auth_version_name(token[api_settings.USER_ID_CLAIM])
+        if (is_revoked(token)
+                or get_versions(name)[name] != token.get('auth_version')):
+            raise InvalidToken(REVOKED_TOKEN_ERROR)
+        return token
+
+    def get_user(self, validated_token):
+        data = {claim: validated_token.get(claim) for claim in USER_CLAIMS}
+        data.update(id=validated_token[api_settings.USER_ID_CLAIM],
+                    is_active=True)
+        # from_db ожидает значения в порядке полей модели.
+        names = [field.attname for field in User._meta.concrete_fields
+                 if field.attname in data]
+        return User.from_db(DEFAULT_DB_ALIAS, names,
+                            [data[name] for name in names])
@@ -0,0 +1,94 @@
+"""Загрузка картинок рецептов в multipart/form-data.
+
+Файл пишется во временный файл по частям, поэтому воркер не держит в памяти
+ни тело запроса целиком, ни декодированную картинку. Размер проверяется по
+мере чтения, разрешение - по заголовку файла до полного декодирования.
+"""
+import json
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+IMAGE_TOO_LARGE_ERROR = 'Размер картинки превышает {limit} МБ'
+IMAGE_DIMENSIONS_ERROR = 'Разрешение картинки превышает {limit} пикселей'
+IMAGE_INVALID_ERROR = 'Загрузите корректную картинку'
+JSON_FIELD_ERROR = 'Поле {field} должно содержать JSON'
+
+
+def check_image_size(size):
+    limit = settings.RECIPE_IMAGE_MAX_SIZE
+    if size > limit:
+        raise serializers.ValidationError(
+            IMAGE_TOO_LARGE_ERROR.format(limit=limit // 2 ** 20))
+
+
+def check_image_dimensions(file):
+    """Читает только заголовок картинки и проверяет ее разрешение."""
+    position = file.tell()
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        raise serializers.ValidationError(IMAGE_INVALID_ERROR)
+    finally:
+        file.seek(position)
+    limit = settings.RECIPE_IMAGE_MAX_PIXELS
+    if width * height > limit:
+        raise serializers.ValidationError(
+            IMAGE_DIMENSIONS_ERROR.format(limit=limit))
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файл на диск и обрывает загрузку при превышении лимита."""
+
+    def handle_raw_input(self, input_data, meta, content_length, boundary,
+                         encoding=None):
+        if content_length:
+            self.check_size(content_length)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        self.check_size(self.received)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_size(self, size):
+        try:
+            check_image_size(size)
+        except serializers.ValidationError as error:
+            raise serializers.ValidationError({'image': error.detail})
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """multipart-вариант тела рецепта.
+
+    Картинка передается файлом в поле image, вложенные поля tags и
+    ingredients - строками JSON, остальные поля - как есть.
+    """
+    json_fields = ('tags', 'ingredients')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request._request.upload_handlers = [
+            LimitedTemporaryFileUploadHandler(request._request)]
+        result = super().parse(stream, media_type, parser_context)
+        return DataAndFiles(self.decode_json_fields(result.data),
+                            result.files)
+
+    def decode_json_fields(self, query_dict):
+        data = query_dict.copy()
+        for field in self.json_fields:
+            if field not in data:
+                continue
+            try:
+                data[field] = json.loads(data[field])
+            except ValueError:
+                raise ParseError(JSON_FIELD_ERROR.format(field=field))
+        return data
@@ -1,4 +1,7 @@
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.async_views import wrap_async_reads
+from api.views import (IngredientViewSet, JWTViewSet, RecipeViewSet,
+                       TagViewSet, UserViewSet)
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -7,8 +10,15 @@ router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'users', UserViewSet, basename='users')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
+if settings.AUTH_MODE in ('jwt', 'both'):
+    router.register(r'auth/jwt', JWTViewSet, basename='jwt')
+
+router_urls = router.urls
+if settings.ASYNC_READS:
+    router_urls = wrap_async_reads(router_urls)
 
 urlpatterns = [
-    path('', include(router.urls)),
-    path('auth/', include('djoser.urls.authtoken')),
+    path('', include(router_urls)),
 ]
+if settings.AUTH_MODE in ('token', 'both'):
+    urlpatterns.append(path('auth/', include('djoser.urls.authtoken')))
@@ -1,70 +1,182 @@
+import os
 from urllib.parse import unquote
 
+from api.bulk import RecipeImporter, export_lines
+from api.cache import AnonymousCacheMixin, ConditionalGetMixin, get_versions
 from api.filters import RecipeFilter
-from api.paginators import LimitPageNumberPagination
+from api.paginators import FeedPagination
 from api.permissions import IsAdminOrReadOnly, IsAuthorOrAdminOrReadOnly
-from api.renders import IngredientDataRendererTXT
-from api.serializers import (IngredientAmountSerializer, IngredientSerializer,
-                             RecipeSerializer, ShortRecipeSerializer,
-                             TagSerializer, UserCreateSerializer,
-                             UserSerializer, UserSubSerializer)
+from api.reference import tag_reference
+from api.renders import (IngredientDataRendererCSV, IngredientDataRendererPDF,
+                         IngredientDataRendererTXT)
+from api.search import ingredient_index, similar_by_name
+from api.serializers import (IngredientSerializer, RecipeSerializer,
+                             ShortRecipeSerializer, TagSerializer,
+                             UserCreateSerializer, UserSerializer,
+                             UserSubSerializer, reset_subscribed_ids)
+from api.tokens import UserRefreshToken, revoke
+from api.uploads import RecipeMultiPartParser
 from django.conf import settings
-from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.contrib.auth import get_user_model, user_logged_in
+from django.db.models import Prefetch, Value
+from django.db.transaction import atomic
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser.serializers import TokenCreateSerializer
 from djoser.views import UserViewSet
 from recipes.models import (Favorites, Ingredient, Recipe, ShoppingCart,
-                            Subscriptions, Tag)
+                            ShoppingListItem, Subscriptions, Tag)
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import DjangoModelPermissions
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
 
 User = get_user_model()
 
 
+def get_positive_int(request, param):
+    try:
+        value = int(request.query_params.get(param, ''))
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+def get_subscriptions(user, recipes_limit):
+    recipes = Recipe.objects.all()
+    if recipes_limit:
+        recipes = recipes.latest_per_author(recipes_limit)
+    return User.objects.filter(subscribing__user=user).annotate(
+        is_subscribed=Value(True),
+    ).prefetch_related(
+        Prefetch('recipes', queryset=recipes)
+    ).order_by(*User._meta.ordering)
+
+
+def get_recipe_validators(pk, recipe, user):
+    """ETag и Last-Modified рецепта по его строке (updated_at, author_id)."""
+    names = ['tags', 'ingredients', f'user:{recipe["author_id"]}']
+    if user.is_anonymous:
+        last_modified = recipe['updated_at']
+    else:
+        names.append(f'user:{user.pk}')
+        last_modified = None
+    versions = get_versions(*names)
+    etag = '-'.join(
+        [f'recipe{pk}', str(recipe['updated_at'].timestamp())]
+        + [str(versions[name]) for name in names])
+    return etag, last_modified
+
+
+def get_recipe_cache_control(user):
+    if user.is_anonymous:
+        return {'public': True, 'max_age': 60}
+    return {'private': True, 'no_cache': True}
+
+
+def get_ingredient_query(request):
+    name = request.query_params.get('name', '')
+    if name and name[0] == '%':
+        name = unquote(name)
+    return name, get_positive_int(request, 'limit')
+
+
 class ErrorMessage:
     SUB_MSG_ERROR = {'errors': 'Вы не подписаны на данного пользователя'}
     FAV_MSG_ERROR = {'error': 'Рецепт уже добавлен в избранное'}
     FAV_NO_RECIPE_ERROR = {'errors': 'Рецепта нет в избранном'}
     RECIPE_ALREADY_IN_ERROR = {'errors': 'Рецепта нет в избранном'}
     SHOP_NO_RECIPE_ERROR = {'errors': 'Рецепта нет в списке покупок'}
+    EMPTY_IMPORT_ERROR = {'errors': 'Передайте рецепты в формате NDJSON'}
+
+
+class JWTViewSet(viewsets.ViewSet):
+    """Выдача, обновление и отзыв JWT (см. api.tokens)."""
+    permission_classes = (permissions.AllowAny,)
+
+    @action(methods=('POST',), detail=False, url_path='create')
+    def create_token(self, request):
+        serializer = TokenCreateSerializer(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.user
+        user_logged_in.send(sender=user.__class__, request=request,
+                            user=user)
+        return self.token_response(UserRefreshToken.for_user(user))
+
+    @action(methods=('POST',), detail=False)
+    def refresh(self, request):
+        _, refresh = UserRefreshToken.rotate(request.data.get('refresh'))
+        return self.token_response(refresh)
+
+    @action(methods=('POST',), detail=False,
+            permission_classes=(permissions.IsAuthenticated,))
+    def logout(self, request):
+        if isinstance(request.auth, AccessToken):
+            revoke(request.auth)
+        raw_token = request.data.get('refresh')
+        if not raw_token:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        try:
+            refresh = UserRefreshToken(raw_token)
+        except TokenError:
+            refresh = None
+        if refresh is not None and (
+                refresh.get(jwt_settings.USER_ID_CLAIM) == request.user.pk):
+            revoke(refresh)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def token_response(self, refresh):
+        return Response({'access': str(refresh.access_token),
+                         'refresh': str(refresh)})
 
 
 class UserViewSet(UserViewSet, viewsets.ModelViewSet, ErrorMessage):
     queryset = User.objects.all()
     permission_classes = (DjangoModelPermissions,)
+    pagination_class = FeedPagination
+    keyset_ordering = ('-id',)
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return UserCreateSerializer
         return UserSerializer
 
+    def get_sub_context(self):
+        return {'request': self.request,
+                'recipes_limit': get_positive_int(self.request,
+                                                  'recipes_limit')}
+
     @action(methods=('GET',),
             detail=False,
             url_path='me',
             url_name='me',
             permission_classes=(permissions.IsAuthenticated,))
     def me(self, request, *args, **kwargs):
-        self.object = User.objects.get(pk=request.user.id)
-        serializer = self.get_serializer(self.object)
+        serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
     @action(methods=('POST', 'DELETE'),
             detail=True,
             permission_classes=(permissions.IsAuthenticated,))
+    @atomic
     def subscribe(self, request, *args, **kwargs):
         pk = kwargs.get('id',)
         author = get_object_or_404(User, pk=pk)
         user = self.request.user
         if request.method == 'POST':
             serializer = UserSubSerializer(
-                author, data=request.data, context={'request': request}
+                author, data=request.data, context=self.get_sub_context()
             )
             if serializer.is_valid():
                 sub = Subscriptions(author=author, user=user)
                 sub.save()
+                reset_subscribed_ids(request)
                 return Response(
                     serializer.data,
                     status=status.HTTP_201_CREATED)
@@ -85,28 +197,73 @@ class UserViewSet(UserViewSet, viewsets.ModelViewSet, ErrorMessage):
             detail=False,
             permission_classes=(permissions.IsAuthenticated,))
     def subscriptions(self, request, *args, **kwargs):
-        user = request.user
-        subs = User.objects.filter(subscribing__user=user)
+        context = self.get_sub_context()
+        subs = get_subscriptions(request.user, context['recipes_limit'])
         pages = self.paginate_queryset(subs)
-        serializer = UserSubSerializer(
-            pages, context={'request': request}, many=True)
+        serializer = UserSubSerializer(pages, context=context, many=True)
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class ReferenceViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    reference = None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.list_reference)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, self.retrieve_reference, *args, **kwargs)
+
+    def list_reference(self, request):
+        return Response(self.reference.all())
+
+    def retrieve_reference(self, request, pk=None):
+        try:
+            row = self.reference.get_by_id(int(pk))
+        except (TypeError, ValueError):
+            row = None
+        if row is None:
+            raise Http404
+        return Response(row)
+
+
+class TagViewSet(ReferenceViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
+    etag_versions = ('tags',)
+    reference = tag_reference
 
 
-class RecipeViewSet(viewsets.ModelViewSet, ErrorMessage):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    viewsets.ModelViewSet, ErrorMessage):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
-    pagination_class = LimitPageNumberPagination
+    pagination_class = FeedPagination
+    keyset_ordering = ('-pub_date', '-id')
+    conditional_actions = ('retrieve',)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    parser_classes = (JSONParser, RecipeMultiPartParser)
+
+    def get_queryset(self):
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user)
+
+    def get_validators(self, request, *args, **kwargs):
+        try:
+            recipe = Recipe.objects.filter(pk=kwargs.get('pk')).values(
+                'updated_at', 'author_id').first()
+        except ValueError:
+            recipe = None
+        if recipe is None:
+            return None, None
+        return get_recipe_validators(kwargs['pk'], recipe, request.user)
+
+    def get_cache_control(self, request):
+        return get_recipe_cache_control(request.user)
 
     def perform_create(self, serializer):
         return serializer.save(author=self.request.user)
@@ -114,6 +271,7 @@ class RecipeViewSet(viewsets.ModelViewSet, ErrorMessage):
     @action(methods=('POST', 'DELETE'),
             detail=True,
             permission_classes=(permissions.IsAuthenticated,))
+    @atomic
     def favorite(self, request, *args, **kwargs):
         pk = kwargs.get('pk')
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -141,6 +299,7 @@ class RecipeViewSet(viewsets.ModelViewSet, ErrorMessage):
     @action(methods=('POST', 'DELETE'),
             detail=True,
             permission_classes=(permissions.IsAuthenticated,))
+    @atomic
     def shopping_cart(self, request, *args, **kwargs):
         pk = kwargs.get('pk')
         recipe = get_object_or_404(Recipe, pk=pk)
@@ -169,35 +328,66 @@ class RecipeViewSet(viewsets.ModelViewSet, ErrorMessage):
         methods=('GET',),
         detail=False,
         permission_classes=(permissions.IsAuthenticated,),
-        renderer_classes=[IngredientDataRendererTXT])
+        renderer_classes=(IngredientDataRendererTXT,
+                          IngredientDataRendererCSV,
+                          IngredientDataRendererPDF))
     def download_shopping_cart(self, request, *args, **kwargs):
         user = request.user
-        queryset = Ingredient.objects.filter(
-            ingredient_amount__recipe__shopping_cart__user=user).values(
-            'name',
-            'measurement_unit'
-        ).annotate(amount=Sum('ingredient_amount__amount'))
-        serializer = IngredientAmountSerializer(queryset, many=True)
-        return Response(
-            serializer.data,
-            headers={"Content-Disposition":
-                     f'attachment; filename="{settings.FILE_NAME}"'})
-
-
-class IngredientViewSet(viewsets.ModelViewSet):
+        renderer = request.accepted_renderer
+        rows = ShoppingListItem.objects.filter(user=user).order_by(
+            'ingredient__name').values_list(
+            'ingredient__name', 'amount', 'ingredient__measurement_unit')
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        file_name = os.path.splitext(settings.FILE_NAME)[0]
+        response = StreamingHttpResponse(
+            renderer.stream(rows.iterator(
+                chunk_size=settings.SHOPPING_CART_CHUNK_SIZE)),
+            content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{file_name}.{renderer.format}"')
+        return response
+
+    @action(methods=('GET',), detail=False,
+            permission_classes=(permissions.IsAdminUser,))
+    def export(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(
+            self.get_queryset().order_by('id'))
+        response = StreamingHttpResponse(
+            export_lines(queryset),
+            content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"')
+        return response
+
+    @action(methods=('POST',), detail=False, url_path='import',
+            permission_classes=(permissions.IsAdminUser,))
+    def import_recipes(self, request, *args, **kwargs):
+        stream = request.stream
+        if stream is None:
+            return Response(self.EMPTY_IMPORT_ERROR,
+                            status=status.HTTP_400_BAD_REQUEST)
+        lines = (line.decode('utf-8', errors='replace')
+                 for line in iter(stream.readline, b''))
+        report = RecipeImporter(request.user).run(lines)
+        return Response(report, status=(
+            status.HTTP_201_CREATED if report['created']
+            else status.HTTP_400_BAD_REQUEST))
+
+
+class IngredientViewSet(ReferenceViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
+    etag_versions = ('ingredients',)
+    reference = ingredient_index
 
-    def get_queryset(self):
-        queryset = self.queryset
-        name = self.request.GET.get('name', '')
-        if name:
-            if name[0] == '%':
-                name = unquote(name)
-            name = name.lower()
-            icontains_query = queryset.filter(name__icontains=name)
-            queryset = icontains_query
-            return queryset
-        return queryset
+    def list_reference(self, request):
+        name, limit = get_ingredient_query(request)
+        result = ingredient_index.search(name, limit)
+        if name and not result:
+            result = similar_by_name(self.get_queryset(), name).values(
+                'id', 'name', 'measurement_unit')[:limit]
+        return Response(result)
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import sys
+from datetime import timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -53,7 +55,12 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
 ]
 
+if 'postgresql' in os.getenv('DB_ENGINE', 'django.db.backends.postgresql'):
+    # Поиск по триграммам (lookup trigram_similar) для api.search
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 MIDDLEWARE = [
+    'api.instrumentation.query_stats_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +68,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.replicas.replica_middleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -98,6 +106,39 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (api.replicas): через запятую хосты PostgreSQL
+# (host или host:port) или, для SQLite, пути к копиям файла базы
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        filter(None, map(str.strip, os.getenv('DB_REPLICAS', '').split(','))),
+        start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if 'sqlite' in DATABASES[alias]['ENGINE']:
+        DATABASES[alias]['NAME'] = replica
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias].update(HOST=host, PORT=port or os.getenv('DB_PORT'))
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Сколько секунд после изменения пользователь читает только из primary
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Несколько воркеров должны работать с общим кешем (Redis, Memcached): в нем
+# хранятся версии справочников и кешей. LocMemCache подходит только для
+# разработки и тестов.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -139,6 +180,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузки в тестах пишутся во временный MEDIA_ROOT
+TEST_RUNNER = 'foodgram.test_runner.TempMediaTestRunner'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -148,12 +192,35 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 # REST Framework
 
+# Режим авторизации: 'token' - токены djoser в базе данных, 'jwt' -
+# короткоживущие JWT без обращения к базе (api.tokens), 'both' - оба сразу
+AUTH_MODE = os.getenv('AUTH_MODE', 'token')
+AUTHENTICATION_CLASSES = {
+    'token': ('api.authentication.CachedTokenAuthentication',),
+    'jwt': ('api.tokens.StatelessJWTAuthentication',),
+}
+AUTHENTICATION_CLASSES['both'] = (
+    AUTHENTICATION_CLASSES['token'] + AUTHENTICATION_CLASSES['jwt'])
+
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework.authentication.TokenAuthentication',),
+    'DEFAULT_AUTHENTICATION_CLASSES': AUTHENTICATION_CLASSES[AUTH_MODE],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 }
 
+# Асинхронные обработчики GET для рецептов, тегов, ингредиентов и подписок
+# (api.async_views). Имеют смысл под ASGI-сервером, см. README.
+ASYNC_READS = os.getenv('ASYNC_READS', 'false').lower() == 'true'
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_MINUTES', 5))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(
+        days=int(os.getenv('JWT_REFRESH_DAYS', 7))),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+    'UPDATE_LAST_LOGIN': False,
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'PERMISSIONS': {
@@ -168,9 +235,90 @@ DJOSER = {
     'HIDE_USERS': False
 }
 
+# Учет SQL-запросов каждого HTTP-запроса (api.instrumentation): заголовок
+# Server-Timing и строка JSON в логгере api.queries
+QUERY_INSTRUMENTATION = (
+    os.getenv('QUERY_INSTRUMENTATION', 'true').lower() == 'true')
+# Сколько одинаковых по форме запросов за один HTTP-запрос считать N+1
+QUERY_REPEAT_THRESHOLD = 5
+# Допустимое число запросов по методу и имени маршрута; при
+# QUERY_BUDGET_STRICT превышение бюджета и N+1 вызывают ошибку (в тестах).
+# Бюджеты включают 2 запроса аутентификации по токену, которого нет в кеше
+QUERY_BUDGETS = {
+    'GET recipes-list': 8,
+    'GET recipes-detail': 7,
+    'GET users-list': 5,
+    'GET users-subscriptions': 5,
+    'GET tags-list': 4,
+    'GET ingredients-list': 3,
+    'POST recipes-list': 15,
+    'PATCH recipes-detail': 20,
+    'recipes-favorite': 8,
+    'recipes-shopping-cart': 12,
+    'users-subscribe': 8,
+}
+QUERY_BUDGET_STRICT = (
+    os.getenv('QUERY_BUDGET_STRICT', 'false').lower() == 'true')
+
+# При запуске тестов в лог пишутся только предупреждения (N+1, бюджеты)
+TESTING = sys.argv[1:2] == ['test']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.queries': {
+            'handlers': ['console'],
+            'level': os.getenv('QUERY_LOG_LEVEL',
+                               'WARNING' if TESTING else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Кеш токенов авторизации в памяти воркера (api.authentication): число
+# записей и время жизни записи в секундах
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 300
+# Время жизни записи, если кеш по умолчанию не общий для воркеров
+# (LocMemCache): выход или смена пароля в одном воркере доходят до
+# остальных не позже чем через это число секунд.
+AUTH_TOKEN_LOCAL_CACHE_TTL = 5
+
 # Константы приложения Recipes для валидации
 MIN_TIME_COOKING = 1
 MIN_AMOUNT = 1
 # Имя карточки покупок
 FILE_NAME = 'foodgram_shopping_cart.txt'
+# Ограничения загружаемых картинок рецептов: размер файла в байтах и
+# число пикселей; проверяются до декодирования картинки
+RECIPE_IMAGE_MAX_SIZE = 10 * 2 ** 20
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+# Фоновая обработка картинок рецептов (recipes.images)
+IMAGE_PIPELINE_BACKEND = os.getenv(
+    'IMAGE_PIPELINE_BACKEND', 'recipes.images.ThreadPoolBackend')
+IMAGE_PIPELINE_WORKERS = 2
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANTS = {
+    'thumbnail': {'size': (320, 320), 'format': 'JPEG'},
+    'thumbnail_webp': {'size': (320, 320), 'format': 'WEBP'},
+    'card_webp': {'size': (960, 960), 'format': 'WEBP'},
+}
+# NDJSON-выгрузка и загрузка каталога рецептов (api.bulk)
+RECIPES_EXPORT_CHUNK_SIZE = 2000
+RECIPES_IMPORT_BATCH_SIZE = 1000
+# Время жизни закешированных ответов ленты для анонимных пользователей
+RECIPES_CACHE_TIMEOUT = 300
+# Как часто воркер сверяет версию справочников тегов и ингредиентов, с
+REFERENCE_DATA_CHECK_INTERVAL = 2
+# Начиная с какой оценки планировщика count=approximate не делает COUNT(*)
+APPROXIMATE_COUNT_THRESHOLD = 10000
+# Размер пачки строк при потоковой выгрузке списка покупок
+SHOPPING_CART_CHUNK_SIZE = 2000
+# TTF-шрифт с кириллицей для PDF-версии списка покупок
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
 SECURE_CROSS_ORIGIN_OPENER_POLICY = None
@@ -1,18 +1,51 @@
+from api.paginators import ApproximateCountPaginator
+from api.search import ILikeContains
 from django.contrib import admin
+from django.db import connection
+from django.db.models import Count
+from recipes import shopping_list
 from recipes.models import (Favorites, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Subscriptions, Tag)
+                            ShoppingCart, ShoppingListItem, Subscriptions, Tag)
 
 admin.site.site_header = 'Проект Foodgram'
 admin.site.index_title = 'Панель Администратора'
 admin.site.site_title = 'Проект Foodgram'
 
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без точного COUNT(*) по всей таблице.
+
+    Число строк берется из оценки планировщика PostgreSQL, а счетчик
+    "всего N" рядом с результатами поиска не запрашивается. Поиск по
+    названиям рецептов и ингредиентов на PostgreSQL идет через ILIKE,
+    который обслуживают GIN-индексы pg_trgm (см. api.search).
+    """
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    empty_value_display = '-пусто-'
+    trigram_search_fields = ('name', 'recipe__name', 'ingredient__name')
+
+    def get_search_fields(self, request):
+        fields = super().get_search_fields(request)
+        if connection.vendor != 'postgresql':
+            return fields
+        return tuple(
+            f'{field}__{ILikeContains.lookup_name}'
+            if field in self.trigram_search_fields else field
+            for field in fields)
+
+
 class IngredientAmountInline(admin.TabularInline):
     model = IngredientAmount
+    autocomplete_fields = ('ingredient',)
+    extra = 1
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
 
 
 @admin.register(Recipe)
-class AdminRecipe(admin.ModelAdmin):
+class AdminRecipe(LargeTableAdmin):
     list_display = (
         'name',
         'author',
@@ -21,15 +54,24 @@ class AdminRecipe(admin.ModelAdmin):
         'pub_date',
     )
     list_filter = ('tags',)
+    list_select_related = ('author',)
     search_fields = ('author__username', 'author__email', 'name')
+    autocomplete_fields = ('author',)
+    filter_horizontal = ('tags',)
     readonly_fields = ('amount_favorites',)
     inlines = (IngredientAmountInline,)
     date_hierarchy = 'pub_date'
-    empty_value_display = '-пусто-'
 
-    @admin.display(description='Кол-во добавлений в избранное')
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            shopping_list.rebuild(form.instance.shopping_cart.values_list(
+                'user_id', flat=True))
+
+    @admin.display(description='Кол-во добавлений в избранное',
+                   ordering='favorites_count')
     def amount_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     @admin.display(description='Текст')
     def short_text(self, obj):
@@ -37,14 +79,13 @@ class AdminRecipe(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class AdminIngredient(admin.ModelAdmin):
+class AdminIngredient(LargeTableAdmin):
     list_display = (
         'name',
         'measurement_unit',
     )
     list_filter = ('measurement_unit',)
     search_fields = ('name',)
-    empty_value_display = '-пусто-'
 
 
 @admin.register(Tag)
@@ -53,14 +94,23 @@ class AdminTag(admin.ModelAdmin):
         'pk',
         'name',
         'color',
-        'slug'
+        'slug',
+        'recipes_count',
     )
     list_filter = ('name',)
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=Count('recipes'))
+
+    @admin.display(description='Кол-во рецептов', ordering='recipes_count')
+    def recipes_count(self, obj):
+        return obj.recipes_count
+
 
 @admin.register(Favorites)
-class AdminFavorites(admin.ModelAdmin):
+class AdminFavorites(LargeTableAdmin):
     list_display = (
         'pk',
         'user',
@@ -72,11 +122,12 @@ class AdminFavorites(admin.ModelAdmin):
         'user__email',
         'recipe__name',
     )
-    empty_value_display = '-пусто-'
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(Subscriptions)
-class AdminSubscriptions(admin.ModelAdmin):
+class AdminSubscriptions(LargeTableAdmin):
     list_display = (
         'pk',
         'user',
@@ -88,11 +139,12 @@ class AdminSubscriptions(admin.ModelAdmin):
         'author__username',
         'author__email',
     )
-    empty_value_display = '-пусто-'
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
 
 
 @admin.register(ShoppingCart)
-class AdminShoppingCart(admin.ModelAdmin):
+class AdminShoppingCart(LargeTableAdmin):
     list_display = (
         'pk',
         'user',
@@ -104,4 +156,22 @@ class AdminShoppingCart(admin.ModelAdmin):
         'user__email',
         'recipe__name',
     )
-    empty_value_display = '-пусто-'
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+
+
+@admin.register(ShoppingListItem)
+class AdminShoppingListItem(LargeTableAdmin):
+    list_display = (
+        'pk',
+        'user',
+        'ingredient',
+        'amount',
+    )
+    search_fields = (
+        'user__username',
+        'user__email',
+        'ingredient__name',
+    )
+    list_select_related = ('user', 'ingredient')
+    autocomplete_fields = ('user', 'ingredient')
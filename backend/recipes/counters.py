@@ -0,0 +1,51 @@
+"""Денормализованные счетчики рецептов и пользователей.
+
+Счетчики меняются выражениями F() сигналами recipes.signals в той же
+транзакции, что и запись в связанной таблице. Массовые вставки
+(bulk_create) сигналов не вызывают, поэтому после них счетчики нужно
+сверить функцией reconcile (команда reconcile_counters).
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from recipes.models import Favorites, Recipe, ShoppingCart, Subscriptions
+
+User = get_user_model()
+
+# Счетчик: (модель со счетчиком, поле, связанная модель, поле связи).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorites, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscriptions, 'author'),
+)
+
+
+def change(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, Value(0))})
+
+
+def track(instance, delta):
+    """Учитывает создание (delta=1) или удаление (delta=-1) instance."""
+    for model, field, related_model, related_field in COUNTERS:
+        if isinstance(instance, related_model):
+            change(model, getattr(instance, f'{related_field}_id'), field,
+                   delta)
+
+
+def count_subquery(related_model, related_field):
+    counts = related_model.objects.filter(
+        **{related_field: OuterRef('pk')}).order_by().values(
+        related_field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile(counters=COUNTERS):
+    """Пересчитывает счетчики и возвращает число исправленных строк."""
+    fixed = {}
+    for model, field, related_model, related_field in counters:
+        actual = count_subquery(related_model, related_field)
+        fixed[f'{model._meta.model_name}.{field}'] = model.objects.exclude(
+            **{field: actual}).update(**{field: actual})
+    return fixed
@@ -0,0 +1,127 @@
+"""Фоновая генерация уменьшенных копий и WebP-вариантов картинок рецептов.
+
+После сохранения рецепта с новой картинкой задача ставится в очередь
+IMAGE_PIPELINE_BACKEND (по умолчанию пул потоков воркера). Готовые пути
+записываются в Recipe.image_variants и отдаются сериализаторами API.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+variants_generated = Signal()
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+
+class SyncBackend:
+    def submit(self, func, *args):
+        func(*args)
+
+
+class ThreadPoolBackend:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PIPELINE_WORKERS,
+            thread_name_prefix='image-pipeline')
+
+    def submit(self, func, *args):
+        self.executor.submit(self.run, func, *args)
+
+    def run(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Ошибка обработки картинки')
+        finally:
+            close_old_connections()
+
+
+_backends = {}
+
+
+def get_backend():
+    path = settings.IMAGE_PIPELINE_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def get_default_images():
+    # Заглушка default.jpg общая для всех рецептов без картинки: варианты
+    # для нее не создаются, иначе каждый такой рецепт перезаписывал бы
+    # одни и те же файлы.
+    from recipes.models import Recipe
+
+    return ('', Recipe._meta.get_field('image').default)
+
+
+def schedule_variants(recipe):
+    if recipe.image.name in get_default_images():
+        return
+    pk = recipe.pk
+    transaction.on_commit(
+        lambda: get_backend().submit(generate_variants, pk))
+
+
+def get_variant_path(source, name, image_format):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'recipes/variants/{stem}_{name}.{EXTENSIONS[image_format]}'
+
+
+def render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' and variant.mode not in ('RGB', 'L'):
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(buffer, image_format,
+                 quality=settings.IMAGE_VARIANT_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(pk):
+    from recipes.models import Recipe
+
+    recipe = Recipe.objects.filter(pk=pk).only(
+        'image', 'image_variants').first()
+    if recipe is None or recipe.image.name in get_default_images():
+        return
+    source = recipe.image.name
+    if recipe.image_variants.get('source') == source:
+        return
+    try:
+        with default_storage.open(source) as file:
+            image = Image.open(file)
+            image.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Не удалось открыть картинку %s', source)
+        return
+
+    variants = {'source': source}
+    for name, options in settings.IMAGE_VARIANTS.items():
+        path = get_variant_path(source, name, options['format'])
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        variants[name] = default_storage.save(path, ContentFile(
+            render_variant(image, options['size'], options['format'])))
+
+    updated = Recipe.objects.filter(pk=pk, image=source).update(
+        image_variants=variants, updated_at=timezone.now())
+    old = recipe.image_variants
+    for name, path in old.items():
+        if name != 'source' and path not in variants.values():
+            default_storage.delete(path)
+    if updated:
+        variants_generated.send(sender=Recipe, pk=pk)
@@ -1,17 +1,52 @@
 import csv
+import io
 import json
 import mimetypes
 import os
+import re
+import time
+from itertools import islice
 from pathlib import Path
 from typing import Any
 
+from api.cache import bump_recipes_version, bump_version
 from clint.textui import colored
 from django.core.management.base import BaseCommand, CommandParser
+from django.db import IntegrityError, connection
+from django.db.transaction import atomic
 from progress.bar import Bar
 from recipes.models import Ingredient
 
 PROJECT_DIR = Path(__file__).resolve().parents[3]
 DATA_DIR = os.path.join(PROJECT_DIR, 'data')
+FIELDS = ('name', 'measurement_unit')
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file, chunk_size=JSON_CHUNK_SIZE):
+    """Построчно разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидается JSON-массив')
+    position = 1
+    eof = False
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            obj, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield obj
 
 
 class Command(BaseCommand):
@@ -19,15 +54,59 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser: CommandParser) -> None:
         parser.add_argument('file', type=str)
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Количество строк в одной пачке вставки')
+        parser.add_argument(
+            '--truncate', action='store_true',
+            help='Очистить таблицу ингредиентов перед загрузкой')
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help='Пропустить ингредиенты, которые уже есть в базе')
+        parser.add_argument(
+            '--yes', action='store_true',
+            help='Не запрашивать подтверждение очистки таблицы')
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY на PostgreSQL')
 
-    def handle(self, *args: Any, **options: Any) -> str:
+    def handle(self, *args: Any, **options: Any) -> None:
         file = os.path.join(DATA_DIR, options.get('file'))
         mimetype = self.check_file(file)
-        self.clean_to_datebase()
-
-        for i in Bar('Загрузка').iter(self.load_to_datebase(file, mimetype)):
-            obj = Ingredient(**i)
-            obj.save()
+        use_copy = (not options['no_copy']
+                    and connection.vendor == 'postgresql')
+        start = time.monotonic()
+        count = 0
+        bar = Bar('Загрузка')
+        try:
+            with atomic():
+                if options['truncate']:
+                    self.clean_to_datebase(options)
+                for batch in self.batches(
+                        self.load_to_datebase(file, mimetype),
+                        options['batch_size']):
+                    if use_copy:
+                        self.copy_batch(batch, options['upsert'])
+                    else:
+                        Ingredient.objects.bulk_create(
+                            (Ingredient(**row) for row in batch),
+                            batch_size=options['batch_size'],
+                            ignore_conflicts=options['upsert'])
+                    count += len(batch)
+                    bar.next(len(batch))
+                # bulk_create и COPY не вызывают сигналы, поэтому версии
+                # справочника и рецептов повышаются явно (после коммита).
+                bump_version('ingredients')
+                bump_recipes_version()
+        except IntegrityError:
+            self.stderr.write('--- Ингредиенты из файла уже есть в базе. '
+                              'Используйте --upsert или --truncate')
+            raise SystemExit
+        bar.finish()
+        elapsed = max(time.monotonic() - start, 1e-6)
+        self.stdout.write(
+            f'Обработано строк: {count} за {elapsed:.2f} с '
+            f'({count / elapsed:.0f} строк/с)')
         self.stdout.write('Запись в базу данных успешно завершена...')
 
     def check_file(self, file):
@@ -47,27 +126,59 @@ class Command(BaseCommand):
 
         return mimetype
 
-    def clean_to_datebase(self):
-        if Ingredient.objects.exists():
+    def clean_to_datebase(self, options):
+        if not Ingredient.objects.exists():
+            return
+        if not options['yes']:
             answer = input(
                 'Вы хотите очистить данные об ингредиентах? Д или Н: ')
-            if answer.lower() == 'д':
-                Ingredient.objects.all().delete()
-            else:
-                self.stderr.write('--- Запись невозможна. Очистите таблицу')
+            if answer.lower() != 'д':
+                self.stderr.write('--- Очистка таблицы отменена')
                 raise SystemExit
+        Ingredient.objects.all().delete()
+
+    def batches(self, rows, size):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, size))
+            if not batch:
+                return
+            yield batch
+
+    def copy_batch(self, batch, upsert):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            (row['name'], row['measurement_unit']) for row in batch)
+        buffer.seek(0)
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            if not upsert:
+                cursor.copy_expert(
+                    f'COPY {table} (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)', buffer)
+                return
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS fill_db_ingredient '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP')
+            cursor.execute('TRUNCATE fill_db_ingredient')
+            cursor.copy_expert(
+                'COPY fill_db_ingredient (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM fill_db_ingredient '
+                'ON CONFLICT DO NOTHING')
 
     def load_to_datebase(self, file, mimetype):
         with open(file, newline='', encoding='utf-8') as f:
+            if mimetype == 'text/csv':
+                data = csv.DictReader(f, fieldnames=FIELDS)
+            else:
+                data = iter_json_array(f)
             try:
-                if mimetype == 'text/csv':
-                    data = csv.DictReader(
-                        f, fieldnames=('name', 'measurement_unit'))
-                else:
-                    data = json.load(f)
-            except (csv.Error, TypeError):
+                for i in data:
+                    yield {field: i[field] for field in FIELDS}
+            except (csv.Error, ValueError, TypeError, KeyError):
                 self.stderr.write('--- Ошибка файла')
                 raise SystemExit
-
-            for i in data:
-                yield i
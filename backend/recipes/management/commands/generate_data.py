@@ -0,0 +1,174 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+from typing import Any
+
+from api.cache import bump_recipes_version, bump_version
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+from progress.bar import Bar
+from recipes import counters, shopping_list
+from recipes.models import (Favorites, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Subscriptions, Tag)
+
+User = get_user_model()
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса распределения Ципфа для rank = 1..count."""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Генерирует синтетические данные для нагрузочного '
+            'тестирования: пользователей, рецепты, подписки, избранное '
+            'и списки покупок')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=5)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--subscriptions-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности '
+                 'авторов и рецептов')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс имен создаваемых пользователей')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        start = time.monotonic()
+
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        if not ingredient_ids:
+            self.stderr.write('--- Таблица ингредиентов пуста. '
+                              'Сначала выполните fill_db')
+            raise SystemExit
+        tag_ids = self.create_tags(options['tags'])
+        user_ids = self.create_users(options['users'], options['prefix'])
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, tag_ids, ingredient_ids,
+            options['ingredients_per_recipe'])
+        self.create_links(
+            'Подписки', Subscriptions, 'author_id', user_ids, user_ids,
+            options['subscriptions_per_user'])
+        self.create_links(
+            'Избранное', Favorites, 'recipe_id', user_ids, recipe_ids,
+            options['favorites_per_user'])
+        self.create_links(
+            'Списки покупок', ShoppingCart, 'recipe_id', user_ids,
+            recipe_ids, options['cart_per_user'])
+        shopping_list.rebuild(user_ids)
+        counters.reconcile()
+        # Записи созданы через bulk_create без сигналов: справочник тегов и
+        # кеши рецептов в воркерах обновятся по новым версиям.
+        bump_version('tags')
+        bump_recipes_version()
+
+        self.stdout.write(
+            f'Данные сгенерированы за {time.monotonic() - start:.1f} с')
+
+    def bulk_create(self, model, objects, label, total,
+                    ignore_conflicts=False):
+        bar = Bar(label, max=total)
+        created = []
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            created.extend(model.objects.bulk_create(
+                batch, ignore_conflicts=ignore_conflicts))
+            bar.next(len(batch))
+        bar.finish()
+        return created
+
+    def create_tags(self, count):
+        for number in range(count):
+            Tag.objects.get_or_create(
+                slug=f'tag{number}',
+                defaults={'name': f'тег {number}',
+                          'color': f'#{number:06X}'})
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_users(self, count, prefix):
+        password = make_password(None)
+        offset = User.objects.filter(username__startswith=prefix).count()
+        users = self.bulk_create(User, (
+            User(username=f'{prefix}{number}',
+                 email=f'{prefix}{number}@example.com',
+                 first_name=f'Имя{number}',
+                 last_name=f'Фамилия{number}',
+                 password=password)
+            for number in range(offset, offset + count)
+        ), 'Пользователи', count)
+        return [user.pk for user in users]
+
+    def create_recipes(self, count, user_ids, tag_ids, ingredient_ids,
+                       ingredients_per_recipe):
+        author_weights = zipf_weights(len(user_ids), self.skew)
+        now = timezone.now()
+        authors = self.rng.choices(
+            user_ids, cum_weights=author_weights, k=count)
+        recipes = self.bulk_create(Recipe, (
+            Recipe(author_id=author_id,
+                   name=f'Рецепт {number}',
+                   text='Синтетический рецепт для нагрузочного теста',
+                   cooking_time=self.rng.randint(5, 180))
+            for number, author_id in enumerate(authors)
+        ), 'Рецепты', count)
+        # pub_date заполняется auto_now_add, поэтому даты разносятся
+        # отдельным обновлением, чтобы лента имела реалистичный порядок.
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                minutes=self.rng.randint(0, 60 * 24 * 365))
+        Recipe.objects.bulk_update(recipes, ('pub_date',),
+                                   batch_size=self.batch_size)
+        recipe_ids = [recipe.pk for recipe in recipes]
+
+        per_recipe = min(ingredients_per_recipe, len(ingredient_ids))
+        self.bulk_create(IngredientAmount, (
+            IngredientAmount(recipe_id=recipe_id, ingredient_id=pk,
+                             amount=self.rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for pk in self.rng.sample(ingredient_ids, per_recipe)
+        ), 'Ингредиенты рецептов', len(recipe_ids) * per_recipe,
+            ignore_conflicts=True)
+        self.bulk_create(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(
+                tag_ids, self.rng.randint(1, min(3, len(tag_ids))))
+        ), 'Теги рецептов', len(recipe_ids), ignore_conflicts=True)
+        return recipe_ids
+
+    def create_links(self, label, model, target_field, user_ids, target_ids,
+                     per_user):
+        if not target_ids or not per_user:
+            return
+        weights = zipf_weights(len(target_ids), self.skew)
+
+        def links():
+            for user_id in user_ids:
+                targets = set(self.rng.choices(
+                    target_ids, cum_weights=weights, k=per_user))
+                if target_field == 'author_id':
+                    targets.discard(user_id)
+                for target_id in targets:
+                    yield model(user_id=user_id, **{target_field: target_id})
+
+        self.bulk_create(model, links(), label, len(user_ids) * per_user,
+                         ignore_conflicts=True)
@@ -0,0 +1,33 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from recipes.images import generate_variants, get_default_images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создает уменьшенные копии и WebP-варианты картинок рецептов, '
+            'для которых они отсутствуют или устарели')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--recipe', type=int, action='append', dest='recipes',
+            help='id рецепта; можно указать несколько раз')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать варианты даже для актуальных картинок')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        recipes = Recipe.objects.exclude(
+            image__in=get_default_images()).only('image', 'image_variants')
+        if options.get('recipes'):
+            recipes = recipes.filter(pk__in=options['recipes'])
+        count = 0
+        for recipe in recipes.iterator():
+            if options['force']:
+                Recipe.objects.filter(pk=recipe.pk).update(image_variants={})
+            elif recipe.image_variants.get('source') == recipe.image.name:
+                continue
+            generate_variants(recipe.pk)
+            count += 1
+        self.stdout.write(f'Обработано картинок: {count}')
@@ -0,0 +1,19 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db.transaction import atomic
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводные списки покупок по таблице ShoppingCart'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; можно указать несколько раз')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        with atomic():
+            count = shopping_list.rebuild(options.get('users'))
+        self.stdout.write(f'Пересчитано позиций списков покупок: {count}')
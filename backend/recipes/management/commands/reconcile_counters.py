@@ -0,0 +1,16 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = ('Сверяет денормализованные счетчики избранного, списков '
+            'покупок, рецептов и подписчиков с исходными таблицами')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        with atomic():
+            fixed = counters.reconcile()
+        for name, count in fixed.items():
+            self.stdout.write(f'{name}: исправлено строк {count}')
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    counters = (
+        (Recipe, 'favorites_count', 'Favorites', 'recipe'),
+        (Recipe, 'shopping_cart_count', 'ShoppingCart', 'recipe'),
+        (User, 'recipes_count', 'Recipe', 'author'),
+        (User, 'followers_count', 'Subscriptions', 'author'),
+    )
+    for model, field, related_name, related_field in counters:
+        related = apps.get_model('recipes', related_name)
+        counts = related.objects.filter(
+            **{related_field: models.OuterRef('pk')}).order_by().values(
+            related_field).annotate(count=models.Count('pk')).values('count')
+        model.objects.update(**{field: Coalesce(
+            models.Subquery(counts, output_field=models.IntegerField()), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_image_variants'),
+        ('users', '0006_customuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
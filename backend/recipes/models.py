@@ -2,11 +2,43 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.db.models.functions import RowNumber
+from users.models import CountersMixin
 
 User = get_user_model()
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredient_amount',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredient')))
+
+    def latest_per_author(self, limit):
+        ordering = (models.F('pub_date').desc(), models.F('id').desc())
+        return self.annotate(
+            author_rank=models.Window(
+                RowNumber(),
+                partition_by=models.F('author'),
+                order_by=ordering)
+        ).filter(author_rank__lte=limit).order_by(*ordering)
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False))
+        return self.annotate(
+            is_favorited=models.Exists(Favorites.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))))
+
+
+class Recipe(CountersMixin, models.Model):
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -24,6 +56,12 @@ class Recipe(models.Model):
         default='default.jpg',
         blank=False,
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание',
         max_length=5000)
@@ -51,11 +89,31 @@ class Recipe(models.Model):
         auto_now_add=True,
         editable=False,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'shopping_cart_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'), name='recipe_feed_idx'),
+        )
 
     def __str__(self):
         return self.name
@@ -232,3 +290,33 @@ class ShoppingCart(models.Model):
 
     def __str__(self) -> str:
         return f'{self.recipe} в списке покупок {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Покупатель',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        'Ingredient',
+        verbose_name='Ингредиент',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient',),
+                name='unique_shopping_list_item'),)
+
+    def __str__(self) -> str:
+        return f'{self.ingredient} {self.amount} для {self.user}'
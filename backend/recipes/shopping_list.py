@@ -0,0 +1,77 @@
+"""Поддержка таблицы ShoppingListItem — суммарных количеств ингредиентов
+из списка покупок каждого пользователя.
+
+Таблица обновляется в той же транзакции, что и ShoppingCart (см.
+recipes.signals) и состав рецепта (RecipeSerializer.update), поэтому
+выгрузка списка покупок — одно чтение по индексу (user, ingredient).
+"""
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+from recipes.models import IngredientAmount, ShoppingCart, ShoppingListItem
+
+
+def get_amounts(recipe):
+    return dict(IngredientAmount.objects.filter(recipe=recipe).values_list(
+        'ingredient_id', 'amount'))
+
+
+def apply_deltas(user_ids, deltas):
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=pk)
+         for user_id in user_ids
+         for pk, delta in deltas.items() if delta > 0),
+        ignore_conflicts=True)
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    items.update(amount=Greatest(
+        F('amount') + Case(
+            *(When(ingredient_id=pk, then=Value(delta))
+              for pk, delta in deltas.items()),
+            default=Value(0),
+            output_field=IntegerField()),
+        Value(0)))
+    items.filter(amount=0).delete()
+
+
+def add_recipe(user, recipe):
+    apply_deltas((user.pk,), get_amounts(recipe))
+
+
+def remove_recipe(user, recipe):
+    apply_deltas((user.pk,), {
+        pk: -amount for pk, amount in get_amounts(recipe).items()})
+
+
+def change_recipe(recipe, old_amounts, new_amounts):
+    deltas = {
+        pk: new_amounts.get(pk, 0) - old_amounts.get(pk, 0)
+        for pk in old_amounts.keys() | new_amounts.keys()
+    }
+    if any(deltas.values()):
+        apply_deltas(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True),
+            deltas)
+
+
+def rebuild(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    carts = {'recipe__shopping_cart__isnull': False}
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+        carts = {'recipe__shopping_cart__user_id__in': user_ids}
+    items.delete()
+    rows = IngredientAmount.objects.filter(**carts).values(
+        'recipe__shopping_cart__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    created = ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=row['recipe__shopping_cart__user_id'],
+                          ingredient_id=row['ingredient_id'],
+                          amount=row['total'])
+         for row in rows.iterator()),
+        batch_size=1000)
+    return len(created)
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from recipes import counters, shopping_list
+from recipes.images import schedule_variants
+from recipes.models import Favorites, Recipe, ShoppingCart, Subscriptions
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(sender, instance, **kwargs):
+    if instance.image_variants.get('source') != instance.image.name:
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipe(instance.user, instance.recipe)
+
+
+# pre_delete срабатывает до каскадного удаления IngredientAmount, поэтому
+# состав рецепта еще доступен и при удалении самого рецепта.
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    shopping_list.remove_recipe(instance.user, instance.recipe)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favorites)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscriptions)
+def increment_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.track(instance, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Favorites)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscriptions)
+def decrement_counters(sender, instance, **kwargs):
+    counters.track(instance, -1)
@@ -1,9 +1,17 @@
 from datetime import datetime
+from io import StringIO
+from unittest import mock
 
+from django.contrib import admin
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from recipes import counters
 from recipes.models import (Favorites, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Subscriptions, Tag)
+                            ShoppingCart, ShoppingListItem, Subscriptions, Tag)
 
 User = get_user_model()
 
@@ -226,3 +234,160 @@ class SubscriptionsModelTest(TestCase):
                 self.assertEqual(
                     sub._meta.get_field(value).verbose_name, expected
                 )
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='root', email='root@test.ru', password='Gsdfks5252')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = Recipe.objects.count()
+        for number in range(start, start + count):
+            user = User.objects.create(username=f'user{number}',
+                                       email=f'user{number}@test.ru')
+            recipe = Recipe.objects.create(
+                author=user, name=f'Рецепт {number}', text='Текст',
+                cooking_time=5)
+            Favorites.objects.create(user=user, recipe=recipe)
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow(self):
+        urls = ('/admin/recipes/recipe/', '/admin/recipes/favorites/',
+                '/admin/recipes/shoppingcart/', '/admin/users/customuser/')
+        self.add_rows(2)
+        before = {url: self.count_queries(url) for url in urls}
+        self.add_rows(5)
+        after = {url: self.count_queries(url) for url in urls}
+        self.assertEqual(before, after)
+
+    def test_name_search_uses_trigram_lookup(self):
+        request = RequestFactory().get('/admin/recipes/recipe/?q=суп')
+        request.user = self.admin
+        recipe_admin = admin.site._registry[Recipe]
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            fields = recipe_admin.get_search_fields(request)
+        self.assertEqual(
+            fields, ('author__username', 'author__email',
+                     'name__ilike_contains'))
+        response = self.client.get('/admin/recipes/recipe/?q=Рецепт')
+        self.assertEqual(response.status_code, 200)
+
+
+class FillDbCommandTest(TestCase):
+    FILE_ROWS = 2188
+
+    def fill_db(self, *args):
+        call_command('fill_db', 'ingredients.csv', *args,
+                     stdout=StringIO(), stderr=StringIO())
+
+    def test_plain_run_appends(self):
+        Ingredient.objects.create(name='тестовый', measurement_unit='г')
+        self.fill_db()
+        self.assertEqual(Ingredient.objects.count(), self.FILE_ROWS + 1)
+        self.assertTrue(Ingredient.objects.filter(name='тестовый').exists())
+
+    def test_plain_run_rejects_duplicates(self):
+        Ingredient.objects.create(name='абрикосовое варенье',
+                                  measurement_unit='г')
+        with self.assertRaises(SystemExit):
+            self.fill_db()
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+    def test_upsert_skips_duplicates(self):
+        Ingredient.objects.create(name='абрикосовое варенье',
+                                  measurement_unit='г')
+        Ingredient.objects.create(name='тестовый', measurement_unit='г')
+        self.fill_db('--upsert')
+        self.assertEqual(Ingredient.objects.count(), self.FILE_ROWS + 1)
+
+    def test_truncate(self):
+        Ingredient.objects.create(name='тестовый', measurement_unit='г')
+        self.fill_db('--truncate', '--yes')
+        self.assertEqual(Ingredient.objects.count(), self.FILE_ROWS)
+        self.assertFalse(Ingredient.objects.filter(name='тестовый').exists())
+
+    def test_truncate_cancelled(self):
+        Ingredient.objects.create(name='тестовый', measurement_unit='г')
+        with mock.patch('builtins.input', return_value='н'):
+            with self.assertRaises(SystemExit):
+                self.fill_db('--truncate')
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+
+class GenerateDataCommandTest(TestCase):
+    OPTIONS = {'users': 6, 'recipes': 12, 'tags': 3,
+               'ingredients_per_recipe': 3, 'subscriptions_per_user': 2,
+               'favorites_per_user': 3, 'cart_per_user': 2, 'seed': 7}
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(10))
+
+    def generate(self):
+        call_command('generate_data', stdout=StringIO(), stderr=StringIO(),
+                     **self.OPTIONS)
+
+    def snapshot(self):
+        """Сгенерированные данные без первичных ключей."""
+        return {
+            'recipes': list(Recipe.objects.order_by('name').values_list(
+                'name', 'author__username', 'cooking_time')),
+            'amounts': list(IngredientAmount.objects.order_by(
+                'recipe__name', 'ingredient__name').values_list(
+                'recipe__name', 'ingredient__name', 'amount')),
+            'favorites': list(Favorites.objects.order_by(
+                'user__username', 'recipe__name').values_list(
+                'user__username', 'recipe__name')),
+            'subscriptions': list(Subscriptions.objects.order_by(
+                'user__username', 'author__username').values_list(
+                'user__username', 'author__username')),
+        }
+
+    def test_row_counts(self):
+        self.generate()
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(Tag.objects.count(), 3)
+        self.assertEqual(Recipe.objects.count(), 12)
+        self.assertEqual(IngredientAmount.objects.count(), 12 * 3)
+        self.assertLessEqual(Favorites.objects.count(), 6 * 3)
+        self.assertLessEqual(ShoppingCart.objects.count(), 6 * 2)
+        self.assertTrue(ShoppingCart.objects.exists())
+
+    def test_same_seed_same_data(self):
+        with transaction.atomic():
+            self.generate()
+            first = self.snapshot()
+            transaction.set_rollback(True)
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_counters_and_shopping_list_consistent(self):
+        self.generate()
+        self.assertFalse(any(counters.reconcile().values()))
+        expected = {
+            (row['recipe__shopping_cart__user'], row['ingredient']):
+                row['total']
+            for row in IngredientAmount.objects.filter(
+                recipe__shopping_cart__isnull=False).values(
+                'recipe__shopping_cart__user', 'ingredient').annotate(
+                total=Sum('amount'))
+        }
+        self.assertTrue(expected)
+        actual = {
+            (item.user_id, item.ingredient_id): item.amount
+            for item in ShoppingListItem.objects.all()
+        }
+        self.assertEqual(actual, expected)
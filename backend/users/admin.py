@@ -1,3 +1,4 @@
+from api.paginators import ApproximateCountPaginator
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from users.models import CustomUser
@@ -16,9 +17,13 @@ class AdminUser(UserAdmin):
         'is_staff',
         'is_superuser',
         'date_joined',
+        'recipes_count',
+        'followers_count',
     )
     list_filter = ('is_superuser', 'is_staff', 'is_active')
-    search_fields = ('email', 'first_name')
+    search_fields = ('email', 'username', 'first_name')
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     list_display_links = ('pk', 'username')
     readonly_fields = ('date_joined',)
     date_hierarchy = 'date_joined'
@@ -3,7 +3,30 @@ from django.core.validators import RegexValidator
 from django.db import models
 
 
-class CustomUser(AbstractUser):
+class CountersMixin:
+    """Не перезаписывает денормализованные счетчики при save().
+
+    Счетчики counter_fields меняются только выражениями F() (см.
+    recipes.counters). Сохранение всей строки записало бы значения,
+    загруженные вместе с объектом, и потеряло бы изменения, сделанные
+    параллельно, поэтому обновляются все поля, кроме счетчиков.
+    """
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if update_fields is None and not force_insert and not (
+                self._state.adding):
+            skipped = set(self.counter_fields) | self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+                and field.attname not in skipped]
+        super().save(force_insert=force_insert, force_update=force_update,
+                     using=using, update_fields=update_fields)
+
+
+class CustomUser(CountersMixin, AbstractUser):
     email = models.EmailField(
         verbose_name='Адрес электронной почты',
         max_length=254,
@@ -45,6 +68,18 @@ class CustomUser(AbstractUser):
         null=True,
         blank=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'